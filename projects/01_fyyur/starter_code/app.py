@@ -3,16 +3,19 @@
 #----------------------------------------------------------------------------#
 
 import json
+import functools
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, stream_template
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import exc, or_
+from sqlalchemy import exc, func, tuple_
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from cache import PageCache
+from pool import TimedQueuePool
 from datetime import datetime
 import pytz
 
@@ -23,7 +26,11 @@ import pytz
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+# The one SQLAlchemy instance (and so the one engine and connection pool) of
+# the app; models.py and the other modules import it from here. Its scoped
+# session is removed at the end of every request.
 db = SQLAlchemy(app)
+page_cache = PageCache(app)
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -31,21 +38,114 @@ db = SQLAlchemy(app)
 
 import models
 from models import Venue, Artist, Show
+import search
+import catalogue
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@functools.lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+  # Parsing a Babel pattern and loading its Locale cost far more than applying
+  # them, and only depend on (format, locale), so each pair is compiled once.
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+@functools.lru_cache(maxsize=4096)
+def cached_format_datetime(date, offset, format, locale):
+  # Listings repeat the same start times (and always the same format), so the
+  # formatted strings themselves are memoized too. Aware datetimes hash and
+  # compare by their UTC instant, so the value's own UTC offset is part of
+  # the key: the same instant renders differently in -05:00 and +00:00.
+  if format in ('long', 'short'):
+    return babel.dates.format_datetime(date, format, locale=locale)
+  pattern, locale = datetime_pattern(format, locale)
+  if date.tzinfo is None:
+    date = date.replace(tzinfo=pytz.utc)
+  return pattern.apply(date, locale)
+
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+  # Views pass the datetimes straight from the database; strings are still
+  # accepted for anything that hands the template a serialized value.
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  return cached_format_datetime(value, value.utcoffset(), format, 'en')
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def split_shows(query):
+  # Splits a start_time-ordered query of labelled show columns into past and
+  # upcoming lists in one pass. The comparison against now() happens in the
+  # database so every row is classified against the same instant.
+  past_shows = []
+  upcoming_shows = []
+  for row in query.add_columns((Show.start_time > func.now()).label('upcoming')):
+    show = row._asdict()
+    if show.pop('upcoming'):
+      upcoming_shows.append(show)
+    else:
+      past_shows.append(show)
+  return past_shows, upcoming_shows
+
+def encode_show_cursor(start_time, show_id):
+  return '{0}_{1}'.format(start_time.isoformat(), show_id)
+
+def decode_show_cursor(cursor):
+  # Returns the (start_time, id) the next page starts after, or None for the
+  # first page. Malformed cursors fall back to the first page.
+  if not cursor:
+    return None
+  start_time, _, show_id = cursor.rpartition('_')
+  try:
+    return dateutil.parser.parse(start_time), int(show_id)
+  except (ValueError, OverflowError):
+    return None
+
+class ShowPage(object):
+  # Lazily iterates one keyset page of shows. Rows are produced as the
+  # template consumes them, and next_cursor is known once the page is
+  # exhausted, so a streamed template can link to the next page at its end.
+  def __init__(self, query, per_page):
+    self.query = query
+    self.per_page = per_page
+    self.next_cursor = None
+
+  def __iter__(self):
+    # One row past the page size tells whether there is a next page.
+    for count, row in enumerate(self.query.limit(self.per_page + 1)):
+      if count == self.per_page:
+        self.next_cursor = encode_show_cursor(last.start_time, last.id)
+        break
+      last = row
+      yield row._asdict()
+
+def venue_artist_ids(venue_id):
+  return [artist_id for artist_id, in db.session.query(Show.artist_id).filter_by(venue_id=venue_id).distinct()]
+
+def artist_venue_ids(artist_id):
+  return [venue_id for venue_id, in db.session.query(Show.venue_id).filter_by(artist_id=artist_id).distinct()]
+
+def invalidate_venue(venue_id, artist_ids=None):
+  # A venue is rendered on the venue listing, its own page, the shows listing
+  # and the page of every artist that has a show there.
+  if artist_ids is None:
+    artist_ids = venue_artist_ids(venue_id)
+  page_cache.invalidate('venues', 'venue:{0}'.format(venue_id), 'shows',
+    *['artist:{0}'.format(artist_id) for artist_id in artist_ids])
+
+def invalidate_artist(artist_id):
+  page_cache.invalidate('artists', 'artist:{0}'.format(artist_id), 'shows',
+    *['venue:{0}'.format(venue_id) for venue_id in artist_venue_ids(artist_id)])
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -59,75 +159,54 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached('venues')
 def venues():
-  results = db.session.query(Venue).order_by(Venue.city, Venue.state).all()
-  currentCity = ''
+  results = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_shows_count) \
+    .order_by(Venue.city, Venue.state, Venue.name) \
+    .all()
+
   areas = []
-  count = -1
-  for current in results:
-    if current.city != currentCity:
-      currentCity = current.city
-      count += 1
+  for city, state, venue_id, name, shows in results:
+    if not areas or areas[-1]["city"] != city or areas[-1]["state"] != state:
       areas.append({
-        "city": current.city,
-        "state": current.state,
+        "city": city,
+        "state": state,
         "venues": []
       })
-    shows = 0
-    for show in current.shows:
-      if show.start_time.astimezone(pytz.UTC) > datetime.now().astimezone(pytz.UTC):
-        shows += 1
-    areas[count]["venues"].append({
-        "id": current.id,
-        "name": current.name,
+    areas[-1]["venues"].append({
+        "id": venue_id,
+        "name": name,
         "num_upcoming_shows": shows
       })
-      
-  return render_template('pages/venues.html', areas=areas);
+
+  return render_template('pages/venues.html', areas=areas)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   search_value = request.form.get('search_term', '')
-  result = db.session.query(Venue).filter(Venue.name.ilike('%{0}%'.format(search_value)))
-  venues = result.all()
-  count = result.count()
-  response = {
-    "count": count,
-    "data": []
-  }
-
-  for current in venues:
-    shows = 0
-    for show in current.shows:
-      if show.start_time.astimezone(pytz.UTC) > datetime.now().astimezone(pytz.UTC):
-        shows += 1
-    response["data"].append({
-        "id": current.id,
-        "name": current.name,
-        "num_upcoming_shows": shows
-      })
+  page = request.form.get('page', 1, type=int)
+  response = search.venues(search_value, page)
 
   return render_template('pages/search_venues.html', results=response, search_term=search_value)
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   result = Venue.query.get(venue_id)
   if result == None:
     return render_template('errors/404.html'), 404
-  past_shows = []
-  upcoming_shows = []
-
-  for show in result.shows:
-    artist = {
-      "artist_id": show.artist.id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": str(show.start_time)
-    }
-    if show.start_time.astimezone(pytz.UTC) > datetime.now().astimezone(pytz.UTC):
-      upcoming_shows.append(artist)
-    else:
-      past_shows.append(artist)
+  # The venue's shows and only the artist columns the template needs, in one
+  # joined query instead of lazy-loading show.artist per row.
+  past_shows, upcoming_shows = split_shows(
+    db.session.query(
+      Artist.id.label('artist_id'),
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+      Show.start_time.label('start_time')
+    ).select_from(Show).join(Artist, Show.artist)
+    .filter(Show.venue_id == venue_id)
+    .order_by(Show.start_time)
+  )
 
   venue = {
     "id": result.id,
@@ -181,12 +260,11 @@ def create_venue_submission():
     venue = Venue(name=name,city=city,state=state,address=address,phone=phone,image_link=image_link,facebook_link=facebook_link,website=website,genres=genres)
     db.session.add(venue)
     db.session.commit()
+    page_cache.invalidate('venues')
   except exc.IntegrityError as e:
     error = True
     db.session.rollback()
     print(e.orig.args)
-  finally:
-    db.session.close()
   if error:
     flash('An error occurred. Venue ' + form.name.data + ' could not be listed.')
   else:
@@ -198,7 +276,10 @@ def create_venue_submission():
 def delete_venue(venue_id):
   success = False
   try:
+    artist_ids = venue_artist_ids(venue_id)
     db.session.query(Show).filter_by(venue_id=venue_id).delete()
+    # The bulk delete bypasses the ORM events that keep the counters.
+    models.recount_shows(db.session, artist_ids=artist_ids)
     db.session.query(Venue).filter_by(id=venue_id).delete()
     db.session.commit()
   except exc.IntegrityError as e:
@@ -207,15 +288,15 @@ def delete_venue(venue_id):
     flash('An error occurred. Venue could not be deleted.')
   else:
     success = True
+    invalidate_venue(venue_id, artist_ids)
     flash('Venue was deleted.')
-  finally:
-    db.session.close()
 
   return jsonify({ 'success': success })
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.cached('artists')
 def artists():
   artists = db.session.query(Artist.id, Artist.name).all()
   return render_template('pages/artists.html', artists=artists)
@@ -223,46 +304,27 @@ def artists():
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
   search_value = request.form.get('search_term', '')
-  result = db.session.query(Artist).filter(Artist.name.ilike('%{0}%'.format(search_value)))
-  artists = result.all()
-  count = result.count()
-  response = {
-    "count": count,
-    "data": []
-  }
-
-  for current in artists:
-    shows = 0
-    for show in current.shows:
-      if show.start_time.astimezone(pytz.UTC) > datetime.now().astimezone(pytz.UTC):
-        shows += 1
-    response["data"].append({
-        "id": current.id,
-        "name": current.name,
-        "num_upcoming_shows": shows
-      })
+  page = request.form.get('page', 1, type=int)
+  response = search.artists(search_value, page)
 
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_value)
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   result = Artist.query.get(artist_id)
   if result == None:
     return render_template('errors/404.html'), 404
-  past_shows = []
-  upcoming_shows = []
-
-  for show in result.shows:
-    venue = {
-      "venue_id": show.venue.id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": str(show.start_time)
-    }
-    if show.start_time.astimezone(pytz.UTC) > datetime.now().astimezone(pytz.UTC):
-      upcoming_shows.append(venue)
-    else:
-      past_shows.append(venue)
+  past_shows, upcoming_shows = split_shows(
+    db.session.query(
+      Venue.id.label('venue_id'),
+      Venue.name.label('venue_name'),
+      Venue.image_link.label('venue_image_link'),
+      Show.start_time.label('start_time')
+    ).select_from(Show).join(Venue, Show.venue)
+    .filter(Show.artist_id == artist_id)
+    .order_by(Show.start_time)
+  )
 
   artist = {
     "id": result.id,
@@ -334,9 +396,8 @@ def edit_artist_submission(artist_id):
     print(e.orig.args)
     flash('Error updating Artist!')
   else:
+    invalidate_artist(artist_id)
     flash('Artist was updated!')
-  finally:
-    db.session.close()
 
   return redirect(url_for('show_artist', artist_id=artist_id))
 
@@ -390,9 +451,8 @@ def edit_venue_submission(venue_id):
     print(e.orig.args)
     flash('Error updating Venue!')
   else:
+    invalidate_venue(venue_id)
     flash('Venue was updated!')
-  finally:
-    db.session.close()
 
   return redirect(url_for('show_venue', venue_id=venue_id))
 
@@ -428,12 +488,11 @@ def create_artist_submission():
     artist = Artist(name=name,city=city,state=state,phone=phone,image_link=image_link,facebook_link=facebook_link,website=website,genres=genres,seeking_venue=seeking_venue,seeking_description=seeking_description)
     db.session.add(artist)
     db.session.commit()
+    page_cache.invalidate('artists')
   except exc.IntegrityError as e:
     error = True
     db.session.rollback()
     print(e.orig.args)
-  finally:
-    db.session.close()
   if error:
     flash('An error occurred. Artist ' + form.name.data + ' could not be listed.')
   else:
@@ -445,40 +504,37 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@page_cache.cached('shows')
 def shows():
-  result = db.session.query(Show).all()
-  shows = []
-  for item in result:
-    shows.append({
-      "venue_id": item.venue_id,
-      "venue_name": item.venue.name,
-      "artist_id": item.artist_id,
-      "artist_name": item.artist.name,
-      "artist_image_link": item.artist.image_link,
-      "start_time": str(item.start_time)
-    })
-  return render_template('pages/shows.html', shows=shows)
+  # Keyset pagination on (start_time, id): the page is located through the
+  # ordering itself instead of an OFFSET, so deep pages cost the same as the
+  # first one. Venue and artist columns come from the same joined query.
+  query = db.session.query(
+    Show.id,
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Show.start_time
+  ).select_from(Show).join(Venue, Show.venue).join(Artist, Show.artist) \
+    .order_by(Show.start_time, Show.id)
+
+  after = decode_show_cursor(request.args.get('after'))
+  if after is not None:
+    query = query.filter(tuple_(Show.start_time, Show.id) > tuple_(*after))
+
+  shows = ShowPage(query, app.config['SHOWS_PER_PAGE'])
+  if app.config['STREAM_TEMPLATES']:
+    # flask.stream_template renders as the response is sent, within the request context.
+    return Response(stream_template('pages/shows.html', shows=shows, after=after))
+  return render_template('pages/shows.html', shows=shows, after=after)
 
 @app.route('/shows/search', methods=['POST'])
 def search_shows():
   search_value = request.form.get('search_term', '')
-  result = db.session.query(Show).join(Show.venue).join(Show.artist).filter(or_(Venue.name.ilike('%{0}%'.format(search_value)),Artist.name.ilike('%{0}%'.format(search_value))))
-  shows = result.all()
-  count = result.count()
-  response = {
-    "count": count,
-    "data": []
-  }
-
-  for current in shows:
-    response["data"].append({
-      "venue_id": current.venue_id,
-      "venue_name": current.venue.name,
-      "artist_id": current.artist_id,
-      "artist_name": current.artist.name,
-      "artist_image_link": current.artist.image_link,
-      "start_time": str(current.start_time)
-    })
+  page = request.form.get('page', 1, type=int)
+  response = search.shows(search_value, page)
 
   return render_template('pages/search_shows.html', results=response, search_term=search_value)
 
@@ -499,18 +555,35 @@ def create_show_submission():
     show = Show(venue_id=venue_id,artist_id=artist_id,start_time=start_time)
     db.session.add(show)
     db.session.commit()
+    page_cache.invalidate('shows', 'venues', 'venue:{0}'.format(venue_id), 'artist:{0}'.format(artist_id))
   except exc.IntegrityError as e:
     error = True
     db.session.rollback()
     print(e.orig.args)
-  finally:
-    db.session.close()
   if error:
     flash('An error occurred. Show could not be listed.')
   else:
     flash('Show was successfully listed!')
   return render_template('pages/home.html')
 
+#  Monitoring
+#  ----------------------------------------------------------------
+
+@app.route('/stats/cache')
+def cache_stats():
+  return jsonify(page_cache.stats())
+
+@app.route('/stats/pool')
+def pool_stats():
+  pool = db.engine.pool
+  stats = {
+    "pool": type(pool).__name__,
+    "status": pool.status()
+  }
+  if isinstance(pool, TimedQueuePool):
+    stats.update(pool.stats())
+  return jsonify(stats)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
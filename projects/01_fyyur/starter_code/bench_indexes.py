@@ -0,0 +1,141 @@
+#----------------------------------------------------------------------------#
+# Index benchmark.
+#
+# Seeds a scratch PostgreSQL database with synthetic venues, artists and
+# shows, then runs the queries behind /venues, the venue and artist detail
+# pages, the /shows keyset page and delete_venue twice: once without the
+# indexes from revision 918a362ee356 and once with them. For each query it
+# prints the top of the EXPLAIN ANALYZE plan and the median execution time.
+#
+#   python bench_indexes.py --database-url postgresql://postgres@localhost:5432/fyyur_bench
+#
+# The tables in the target database are DROPPED and recreated.
+#----------------------------------------------------------------------------#
+
+import os
+import argparse
+import statistics
+from sqlalchemy import create_engine, text
+# app has to be imported before models, which imports it back
+from app import app
+from models import db
+
+HOT_INDEXES = (
+  'ix_Venue_city_state_name',
+  'ix_Show_venue_id_start_time',
+  'ix_Show_artist_id_start_time',
+  'ix_Show_start_time_id'
+)
+
+QUERIES = (
+  ('venues listing',
+   'SELECT city, state, id, name, upcoming_shows_count FROM "Venue" ORDER BY city, state, name'),
+  ('venue detail shows',
+   'SELECT "Artist".id, "Artist".name, "Artist".image_link, "Show".start_time, "Show".start_time > now() '
+   'FROM "Show" JOIN "Artist" ON "Artist".id = "Show".artist_id '
+   'WHERE "Show".venue_id = :venue_id ORDER BY "Show".start_time'),
+  ('artist detail shows',
+   'SELECT "Venue".id, "Venue".name, "Venue".image_link, "Show".start_time, "Show".start_time > now() '
+   'FROM "Show" JOIN "Venue" ON "Venue".id = "Show".venue_id '
+   'WHERE "Show".artist_id = :artist_id ORDER BY "Show".start_time'),
+  ('shows keyset page',
+   'SELECT "Show".id, "Show".venue_id, "Venue".name, "Show".artist_id, "Artist".name, "Artist".image_link, "Show".start_time '
+   'FROM "Show" JOIN "Venue" ON "Venue".id = "Show".venue_id JOIN "Artist" ON "Artist".id = "Show".artist_id '
+   'WHERE ("Show".start_time, "Show".id) > (now(), 0) ORDER BY "Show".start_time, "Show".id LIMIT 31'),
+  ('venue artist ids',
+   'SELECT DISTINCT artist_id FROM "Show" WHERE venue_id = :venue_id')
+)
+
+SEED = (
+  '''INSERT INTO "Venue" (name, city, state, address, genres)
+     SELECT 'Venue ' || i, 'City ' || (i % 500), 'ST' || (i % 50), i || ' Main St', ARRAY['Jazz']
+     FROM generate_series(1, :venues) AS i''',
+  '''INSERT INTO "Artist" (name, city, state, genres)
+     SELECT 'Artist ' || i, 'City ' || (i % 500), 'ST' || (i % 50), ARRAY['Rock']
+     FROM generate_series(1, :artists) AS i''',
+  '''INSERT INTO "Show" (venue_id, artist_id, start_time)
+     SELECT 1 + (i::bigint * 7919) % :venues, 1 + (i / 7) % :artists,
+            now() - interval '5 years' + (i % 3650) * interval '1 day' + (i % 24) * interval '1 hour'
+     FROM generate_series(1, :shows) AS i'''
+)
+
+
+def seed(engine, venues, artists, shows):
+  params = {'venues': venues, 'artists': artists, 'shows': shows}
+  with engine.begin() as connection:
+    connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+  db.metadata.drop_all(engine)
+  db.metadata.create_all(engine)
+  with engine.begin() as connection:
+    for statement in SEED:
+      connection.execute(text(statement), params)
+
+
+def hot_indexes():
+  return [index for table in db.metadata.tables.values() for index in table.indexes if index.name in HOT_INDEXES]
+
+
+def analyze(engine):
+  with engine.connect() as connection:
+    connection.execution_options(isolation_level='AUTOCOMMIT').execute(text('VACUUM ANALYZE'))
+
+
+def run(engine, params, repeat):
+  results = {}
+  with engine.connect() as connection:
+    for name, sql in QUERIES:
+      plan = [line for line, in connection.execute(text('EXPLAIN (ANALYZE, BUFFERS) ' + sql), params)]
+      timings = []
+      for _ in range(repeat):
+        explain = connection.execute(text('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql), params).scalar()
+        timings.append(explain[0]['Execution Time'])
+      results[name] = (statistics.median(timings), plan)
+  return results
+
+
+def report(label, results):
+  print('=' * 78)
+  print(label)
+  print('=' * 78)
+  for name, _ in QUERIES:
+    timing, plan = results[name]
+    print('-- {0}: {1:.3f} ms'.format(name, timing))
+    for line in plan[:6]:
+      print('   ' + line)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the Fyyur query indexes.')
+  parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyur_bench'))
+  parser.add_argument('--venues', type=int, default=5000)
+  parser.add_argument('--artists', type=int, default=5000)
+  parser.add_argument('--shows', type=int, default=500000)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  engine = create_engine(args.database_url)
+  print('Seeding {0} venues, {1} artists and {2} shows...'.format(args.venues, args.artists, args.shows))
+  seed(engine, args.venues, args.artists, args.shows)
+  params = {'venue_id': args.venues // 2, 'artist_id': args.artists // 2}
+
+  for index in hot_indexes():
+    index.drop(engine)
+  analyze(engine)
+  before = run(engine, params, args.repeat)
+  report('Without indexes', before)
+
+  for index in hot_indexes():
+    index.create(engine)
+  analyze(engine)
+  after = run(engine, params, args.repeat)
+  report('With indexes', after)
+
+  print('=' * 78)
+  print('{0:<24} {1:>12} {2:>12} {3:>9}'.format('query', 'before ms', 'after ms', 'speedup'))
+  for name, _ in QUERIES:
+    b, a = before[name][0], after[name][0]
+    print('{0:<24} {1:>12.3f} {2:>12.3f} {3:>8.1f}x'.format(name, b, a, b / a if a else float('inf')))
+
+
+if __name__ == '__main__':
+  main()
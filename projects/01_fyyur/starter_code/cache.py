@@ -0,0 +1,222 @@
+#----------------------------------------------------------------------------#
+# Page cache.
+#
+# Caches rendered GET responses keyed by path and query string. Each cached
+# view declares the tags its content depends on ('venues', 'venue:{venue_id}',
+# ...); every tag has a version token stored in the backend and the token is
+# part of the cache key. Write handlers call invalidate() with the tags they
+# touched, which swaps in a fresh token so stale entries are never looked up
+# again and simply age out of the backend.
+#----------------------------------------------------------------------------#
+
+import os
+import time
+import pickle
+import hashlib
+import threading
+from uuid import uuid4
+from functools import wraps
+from collections import OrderedDict
+from flask import current_app, request, session, Response
+
+
+class SimpleCache(object):
+  # In-process LRU cache with per-entry expiry. A timeout of 0 never expires.
+
+  def __init__(self, threshold=500, default_timeout=300):
+    self.threshold = threshold
+    self.default_timeout = default_timeout
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      expires, value = entry
+      if expires and expires < time.time():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def get_many(self, *keys):
+    return [self.get(key) for key in keys]
+
+  def set(self, key, value, timeout=None):
+    if timeout is None:
+      timeout = self.default_timeout
+    expires = time.time() + timeout if timeout else 0
+    with self._lock:
+      self._entries[key] = (expires, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.threshold:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+
+class FileCache(object):
+  # Pickled entries in a directory, one file per key. Shared by every worker
+  # process on the host.
+
+  def __init__(self, cache_dir, threshold=500, default_timeout=300):
+    self.cache_dir = cache_dir
+    self.threshold = threshold
+    self.default_timeout = default_timeout
+    os.makedirs(cache_dir, exist_ok=True)
+
+  def _path(self, key):
+    return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+  def get(self, key):
+    try:
+      with open(self._path(key), 'rb') as f:
+        expires, value = pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.PickleError):
+      return None
+    if expires and expires < time.time():
+      return None
+    return value
+
+  def get_many(self, *keys):
+    return [self.get(key) for key in keys]
+
+  def set(self, key, value, timeout=None):
+    if timeout is None:
+      timeout = self.default_timeout
+    expires = time.time() + timeout if timeout else 0
+    path = self._path(key)
+    tmp = '{0}.{1}.tmp'.format(path, uuid4().hex)
+    with open(tmp, 'wb') as f:
+      pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    self._prune()
+
+  def _prune(self):
+    names = os.listdir(self.cache_dir)
+    if len(names) <= self.threshold:
+      return
+    paths = [os.path.join(self.cache_dir, name) for name in names]
+    paths.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+    for path in paths[:len(paths) - self.threshold]:
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+
+  def clear(self):
+    for name in os.listdir(self.cache_dir):
+      try:
+        os.remove(os.path.join(self.cache_dir, name))
+      except OSError:
+        pass
+
+
+class RedisCache(object):
+  # Any Redis-compatible server. Needs the redis package.
+
+  def __init__(self, url, default_timeout=300, key_prefix='fyyur:'):
+    import redis
+    self.client = redis.Redis.from_url(url)
+    self.default_timeout = default_timeout
+    self.key_prefix = key_prefix
+
+  def get(self, key):
+    value = self.client.get(self.key_prefix + key)
+    return None if value is None else pickle.loads(value)
+
+  def get_many(self, *keys):
+    values = self.client.mget([self.key_prefix + key for key in keys])
+    return [None if value is None else pickle.loads(value) for value in values]
+
+  def set(self, key, value, timeout=None):
+    if timeout is None:
+      timeout = self.default_timeout
+    self.client.set(self.key_prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=timeout or None)
+
+  def clear(self):
+    keys = list(self.client.scan_iter(self.key_prefix + '*'))
+    if keys:
+      self.client.delete(*keys)
+
+
+class PageCache(object):
+
+  def __init__(self, app=None):
+    self.backend = None
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    config = app.config
+    cache_type = config.get('CACHE_TYPE', 'simple')
+    timeout = config.get('CACHE_DEFAULT_TIMEOUT', 300)
+    threshold = config.get('CACHE_THRESHOLD', 500)
+    if cache_type == 'simple':
+      self.backend = SimpleCache(threshold, timeout)
+    elif cache_type == 'file':
+      self.backend = FileCache(config['CACHE_DIR'], threshold, timeout)
+    elif cache_type == 'redis':
+      self.backend = RedisCache(config['CACHE_REDIS_URL'], timeout)
+    elif cache_type == 'null':
+      self.backend = None
+    else:
+      raise ValueError('Unknown CACHE_TYPE: {0}'.format(cache_type))
+
+  def _versions(self, tags):
+    # Tags without a token get a fresh one: an evicted token can then never
+    # resurrect entries cached under an older one.
+    versions = self.backend.get_many(*['tag:' + tag for tag in tags])
+    for i, version in enumerate(versions):
+      if version is None:
+        versions[i] = uuid4().hex
+        self.backend.set('tag:' + tags[i], versions[i], 0)
+    return versions
+
+  def cached(self, *tags):
+    def decorator(f):
+      @wraps(f)
+      def wrapper(*args, **kwargs):
+        # Pages carrying flashed messages are user specific.
+        if self.backend is None or request.method != 'GET' or '_flashes' in session:
+          return f(*args, **kwargs)
+
+        resolved = [tag.format(**kwargs) for tag in tags]
+        key = 'page:{0}|{1}'.format(request.full_path, ','.join(self._versions(resolved)))
+        entry = self.backend.get(key)
+        if entry is not None:
+          self.hits += 1
+          body, status, mimetype = entry
+          return Response(body, status=status, mimetype=mimetype)
+
+        self.misses += 1
+        response = current_app.make_response(f(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+          self.backend.set(key, (response.get_data(), response.status_code, response.mimetype))
+        return response
+      return wrapper
+    return decorator
+
+  def invalidate(self, *tags):
+    if self.backend is None:
+      return
+    for tag in tags:
+      self.backend.set('tag:' + tag, uuid4().hex, 0)
+    self.invalidations += len(tags)
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {
+      "backend": type(self.backend).__name__ if self.backend else None,
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_ratio": float(self.hits) / lookups if lookups else 0.0,
+      "invalidations": self.invalidations
+    }
@@ -0,0 +1,336 @@
+#----------------------------------------------------------------------------#
+# Catalogue import/export.
+#
+#   flask catalogue import venues venues.csv
+#   flask catalogue import shows shows.jsonl --chunk-size 20000
+#   flask catalogue export shows shows.csv
+#
+# Files are CSV (with a header row) or JSON Lines, chosen by extension or
+# --format. Imports stream the file in chunks; each chunk is COPYed into a
+# temporary staging table and merged from there in one statement, so an
+# import can be run again (e.g. as a nightly sync) without duplicating
+# anything:
+#
+#   - venues and artists are upserted on their unique name; rows that are
+#     already identical are left alone,
+#   - shows are inserted unless the same venue, artist and start_time is
+#     already there.
+#
+# Shows reference their venue and artist by venue_name/artist_name, resolved
+# through an in-memory name -> id map; venue_id/artist_id are only used for
+# rows without names, and only mean anything in the database they came
+# from. Exports stream the tables through a server-side cursor and write
+# shows with names only, so an export can be loaded into another database.
+#----------------------------------------------------------------------------#
+
+import io
+import csv
+import json
+import time
+import click
+import dateutil.parser
+from itertools import islice
+from sqlalchemy import text
+from app import app, page_cache
+from models import db, Venue, Artist, Show, refresh_show_counts, invalidate_show_counts
+
+MODELS = {
+  'venues': Venue,
+  'artists': Artist,
+  'shows': Show
+}
+
+# Columns that are maintained by the database rather than imported.
+SKIPPED_COLUMNS = ('id', 'upcoming_shows_count', 'past_shows_count')
+
+# Shows have no id of their own in a file; these columns tell duplicates apart.
+SHOW_KEY = ('venue_id', 'artist_id', 'start_time')
+
+STAGING_TABLE = 'catalogue_staging'
+
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+
+# How NULL is spelled in the CSV fed to COPY; unquoted empty fields stay ''.
+COPY_NULL = '\\N'
+
+
+def file_format(path, format):
+  if format:
+    return format
+  return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(stream, format):
+  if format == 'csv':
+    for row in csv.DictReader(stream):
+      yield row
+  else:
+    for line in stream:
+      if line.strip():
+        yield json.loads(line)
+
+
+def chunks(iterable, size):
+  iterator = iter(iterable)
+  while True:
+    chunk = list(islice(iterator, size))
+    if not chunk:
+      return
+    yield chunk
+
+
+def importable_columns(model):
+  return [column for column in model.__table__.columns if column.name not in SKIPPED_COLUMNS]
+
+
+class RowConverter(object):
+  # Turns raw CSV/JSON rows into column mappings for one model, filling in
+  # Python-side column defaults (COPY would otherwise store NULL) and
+  # resolving venue/artist names for shows. Unknown names or ids raise
+  # KeyError, so the row is skipped instead of failing its whole chunk.
+
+  def __init__(self, model):
+    self.model = model
+    self.columns = importable_columns(model)
+    self.owner_ids = {}
+    if model is Show:
+      self.owner_ids['venue'] = dict(db.session.query(Venue.name, Venue.id))
+      self.owner_ids['artist'] = dict(db.session.query(Artist.name, Artist.id))
+      self.known_ids = dict((kind, set(ids.values())) for kind, ids in self.owner_ids.items())
+
+  def resolve(self, row, kind):
+    name = row.get(kind + '_name')
+    if name:
+      return self.owner_ids[kind][name]
+    owner_id = int(row[kind + '_id'])
+    if owner_id not in self.known_ids[kind]:
+      raise KeyError('{0}_id {1}'.format(kind, owner_id))
+    return owner_id
+
+  def convert(self, row):
+    if self.model is Show:
+      row = dict(row)
+      row['venue_id'] = self.resolve(row, 'venue')
+      row['artist_id'] = self.resolve(row, 'artist')
+
+    mapping = {}
+    for column in self.columns:
+      value = row.get(column.name)
+      if value in (None, ''):
+        if column.default is not None and column.default.is_scalar:
+          value = column.default.arg
+        else:
+          value = None
+      elif column.name == 'genres':
+        if not isinstance(value, list):
+          value = [genre.strip() for genre in value.split(',') if genre.strip()]
+      elif column.name in ('seeking_talent', 'seeking_venue'):
+        if not isinstance(value, bool):
+          value = value.strip().lower() in TRUE_VALUES
+      elif column.name in ('venue_id', 'artist_id'):
+        value = int(value)
+      elif column.name == 'start_time':
+        value = dateutil.parser.parse(value)
+      mapping[column.name] = value
+    return mapping
+
+
+def copy_value(value):
+  if value is None:
+    return COPY_NULL
+  if isinstance(value, bool):
+    return 't' if value else 'f'
+  if isinstance(value, list):
+    return '{' + ','.join('"{0}"'.format(item.replace('\\', '\\\\').replace('"', '\\"')) for item in value) + '}'
+  if hasattr(value, 'isoformat'):
+    return value.isoformat()
+  return value
+
+
+def column_list(names, prefix=''):
+  return ', '.join('{0}"{1}"'.format(prefix, name) for name in names)
+
+
+def copy_rows(table, columns, mappings):
+  # COPY ... FROM STDIN over the session's own connection, so the chunk is
+  # part of the surrounding transaction.
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for mapping in mappings:
+    writer.writerow([copy_value(mapping[column.name]) for column in columns])
+  buffer.seek(0)
+  statement = 'COPY "{0}" ({1}) FROM STDIN WITH (FORMAT csv, NULL \'{2}\')'.format(
+    table, column_list(column.name for column in columns), COPY_NULL)
+  cursor = db.session.connection().connection.cursor()
+  try:
+    cursor.copy_expert(statement, buffer)
+  finally:
+    cursor.close()
+
+
+def merge_statement(model, names):
+  # Moves the staged rows into the model's table, returning (id, inserted)
+  # for every row it inserted or changed.
+  table = model.__tablename__
+  if model is Show:
+    duplicate = ' AND '.join('existing."{0}" = staged."{0}"'.format(name) for name in SHOW_KEY)
+    return '''
+      INSERT INTO "{0}" ({1})
+      SELECT DISTINCT {2} FROM "{3}" staged
+      WHERE NOT EXISTS (SELECT 1 FROM "{0}" existing WHERE {4})
+      RETURNING id, true'''.format(table, column_list(names), column_list(names, 'staged.'), STAGING_TABLE, duplicate)
+  # Rows that already match are not rewritten. xmax is 0 on the rows this
+  # statement inserted, as opposed to updated.
+  updated = [name for name in names if name != 'name']
+  return '''
+    INSERT INTO "{0}" ({1})
+    SELECT {1} FROM "{2}"
+    ON CONFLICT (name) DO UPDATE SET ({3}) = ({4})
+    WHERE ({5}) IS DISTINCT FROM ({4})
+    RETURNING id, xmax = 0'''.format(table, column_list(names), STAGING_TABLE, column_list(updated),
+    column_list(updated, 'EXCLUDED.'), column_list(updated, '"{0}".'.format(table)))
+
+
+def merge_rows(model, mappings):
+  columns = importable_columns(model)
+  names = [column.name for column in columns]
+  if model is not Show:
+    # ON CONFLICT can touch a row only once per statement; the last row with
+    # a name wins, as it does across chunks.
+    mappings = list(dict((mapping['name'], mapping) for mapping in mappings).values())
+  db.session.execute(text('CREATE TEMPORARY TABLE "{0}" ON COMMIT DROP AS SELECT {1} FROM "{2}" WITH NO DATA'.format(
+    STAGING_TABLE, column_list(names), model.__tablename__)))
+  copy_rows(STAGING_TABLE, columns, mappings)
+  return db.session.execute(text(merge_statement(model, names))).fetchall()
+
+
+def invalidate_imported(kind, ids):
+  # A venue or artist is rendered on its listing, its own page, the shows
+  # listing and the page of everyone it has shows with.
+  if not ids:
+    return
+  owner, column, other, other_column = {
+    'venues': ('venue', Show.venue_id, 'artist', Show.artist_id),
+    'artists': ('artist', Show.artist_id, 'venue', Show.venue_id)
+  }[kind]
+  other_ids = [other_id for other_id, in db.session.query(other_column).filter(column.in_(ids)).distinct()]
+  page_cache.invalidate(kind, 'shows',
+    *['{0}:{1}'.format(owner, owner_id) for owner_id in ids] +
+    ['{0}:{1}'.format(other, other_id) for other_id in other_ids])
+
+
+def export_rows(model, chunk_size):
+  if model is Show:
+    # Names rather than ids, which only mean anything in this database.
+    query = db.session.query(
+      Venue.name.label('venue_name'),
+      Artist.name.label('artist_name'),
+      Show.start_time
+    ).select_from(Show).join(Venue, Show.venue).join(Artist, Show.artist).order_by(Show.id)
+  else:
+    query = db.session.query(*[getattr(model, column.name) for column in importable_columns(model)]) \
+      .order_by(model.id)
+  # stream_results keeps the driver from buffering the whole result set.
+  query = query.execution_options(stream_results=True).yield_per(chunk_size)
+  for row in query:
+    yield row._asdict()
+
+
+def export_value(value, format):
+  if hasattr(value, 'isoformat'):
+    return value.isoformat()
+  if format == 'csv' and isinstance(value, list):
+    return ','.join(value)
+  return value
+
+
+@app.cli.group()
+def catalogue():
+  """Bulk import and export of venues, artists and shows."""
+
+
+@catalogue.command('import')
+@click.argument('kind', type=click.Choice(sorted(MODELS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per insert and commit.')
+def import_command(kind, path, format, chunk_size):
+  """Import KIND rows from a CSV or JSON Lines file."""
+  if db.session.get_bind().dialect.name != 'postgresql':
+    raise click.UsageError('catalogue import needs PostgreSQL (COPY and ON CONFLICT).')
+  model = MODELS[kind]
+  format = file_format(path, format)
+  converter = RowConverter(model)
+  read = 0
+  inserted = 0
+  updated_ids = []
+  skipped = 0
+  started = time.time()
+
+  with click.open_file(path, 'r', encoding='utf-8') as stream:
+    for index, chunk in enumerate(chunks(read_rows(stream, format), chunk_size)):
+      mappings = []
+      for offset, row in enumerate(chunk):
+        try:
+          mappings.append(converter.convert(row))
+        except (KeyError, ValueError, TypeError, OverflowError) as e:
+          skipped += 1
+          click.echo('Skipping row {0}: {1!r}'.format(index * chunk_size + offset + 1, e), err=True)
+      # Each chunk commits on its own; a failed import can simply be rerun.
+      for row_id, was_inserted in merge_rows(model, mappings):
+        if was_inserted:
+          inserted += 1
+        else:
+          updated_ids.append(row_id)
+      db.session.commit()
+      read += len(chunk)
+      elapsed = time.time() - started
+      click.echo('{0} {1} read ({2:.0f} rows/s)'.format(read, kind, read / elapsed if elapsed else 0), err=True)
+
+  if model is Show:
+    # Bulk inserts skip the ORM events that maintain the show counters.
+    changed = refresh_show_counts(db.session)
+    db.session.commit()
+    invalidate_show_counts(changed)
+    if inserted:
+      page_cache.invalidate('shows')
+  else:
+    # New venues and artists have no cached pages of their own yet.
+    invalidate_imported(kind, updated_ids)
+    if inserted:
+      page_cache.invalidate(kind)
+
+  elapsed = time.time() - started
+  click.echo('Imported {0} {1}: {2} inserted, {3} updated, {4} unchanged, {5} skipped, in {6:.1f}s ({7:.0f} rows/s).'.format(
+    read - skipped, kind, inserted, len(updated_ids), read - skipped - inserted - len(updated_ids), skipped,
+    elapsed, read / elapsed if elapsed else 0))
+
+
+@catalogue.command('export')
+@click.argument('kind', type=click.Choice(sorted(MODELS)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows fetched per round trip.')
+def export_command(kind, path, format, chunk_size):
+  """Export KIND rows to a CSV or JSON Lines file ('-' for stdout)."""
+  model = MODELS[kind]
+  format = file_format(path, format)
+  exported = 0
+  started = time.time()
+
+  with click.open_file(path, 'w', encoding='utf-8') as stream:
+    writer = None
+    for row in export_rows(model, chunk_size):
+      row = dict((key, export_value(value, format)) for key, value in row.items())
+      if format == 'csv':
+        if writer is None:
+          writer = csv.DictWriter(stream, fieldnames=list(row))
+          writer.writeheader()
+        writer.writerow(row)
+      else:
+        stream.write(json.dumps(row) + '\n')
+      exported += 1
+
+  elapsed = time.time() - started
+  click.echo('Exported {0} {1} in {2:.1f}s ({3:.0f} rows/s).'.format(
+    exported, kind, elapsed, exported / elapsed if elapsed else 0), err=True)
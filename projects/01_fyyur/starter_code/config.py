@@ -1,4 +1,5 @@
 import os
+from pool import TimedQueuePool
 SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -8,4 +9,34 @@ DEBUG = True
 
 # Connect to the database
 SQLALCHEMY_DATABASE_URI = 'postgres://postgres@localhost:5432/fyyur'
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool, per worker process. Keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below Postgres' max_connections.
+SQLALCHEMY_ENGINE_OPTIONS = {
+  'poolclass': TimedQueuePool,
+  'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+  'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+  'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+  # Recycle connections before server or proxy idle timeouts close them.
+  'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+  # Test connections on checkout so a restarted server costs one reconnect.
+  'pool_pre_ping': True
+}
+
+# Number of shows per page on the /shows listing
+SHOWS_PER_PAGE = 30
+
+# Stream long listings to the client while they are being rendered
+STREAM_TEMPLATES = False
+
+# Rendered page cache: 'file' (shared by the worker processes on one host),
+# 'redis' (shared across hosts), 'simple' (in-process LRU) or 'null'.
+# Invalidation reaches only the processes sharing the backend, so with
+# 'simple' other workers, and the flask commands, cannot invalidate each
+# other's pages and serve them stale for up to CACHE_DEFAULT_TIMEOUT.
+CACHE_TYPE = os.environ.get('CACHE_TYPE', 'file')
+CACHE_DEFAULT_TIMEOUT = 300
+CACHE_THRESHOLD = 500
+CACHE_DIR = os.path.join(basedir, '.cache')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
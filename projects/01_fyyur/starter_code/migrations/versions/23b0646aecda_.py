@@ -0,0 +1,40 @@
+"""denormalised upcoming/past show counters on Venue and Artist
+
+Revision ID: 23b0646aecda
+Revises: 273fadf6852f
+Create Date: 2026-10-18 10:41:07.118342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '23b0646aecda'
+down_revision = '273fadf6852f'
+branch_labels = None
+depends_on = None
+
+BACKFILL = '''
+UPDATE "{table}" SET upcoming_shows_count = counts.upcoming, past_shows_count = counts.past
+FROM (
+    SELECT {fk} AS owner_id,
+           count(*) FILTER (WHERE start_time > now()) AS upcoming,
+           count(*) FILTER (WHERE start_time <= now()) AS past
+    FROM "Show" GROUP BY {fk}
+) AS counts
+WHERE "{table}".id = counts.owner_id
+'''
+
+
+def upgrade():
+    for table, fk in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(BACKFILL.format(table=table, fk=fk))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,30 @@
+"""indexes for the hot Venue and Show query predicates
+
+Revision ID: 918a362ee356
+Revises: 23b0646aecda
+Create Date: 2026-10-18 11:58:22.640517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '918a362ee356'
+down_revision = '23b0646aecda'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venue_city_state_name', 'Venue', ['city', 'state', 'name'], unique=False)
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.drop_index('ix_Venue_city_state_name', table_name='Venue')
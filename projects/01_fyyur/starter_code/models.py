@@ -1,11 +1,10 @@
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+import click
+from sqlalchemy import func, Index, event, select, and_, not_, or_, exists
 from flask import Flask
-from app import app
+from app import app, db, page_cache
 from datetime import datetime
 from flask_migrate import Migrate
 
-db = SQLAlchemy(app)
 migrate = Migrate(app,db)
 
 class Venue(db.Model):
@@ -23,7 +22,15 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String(120), default="")
     genres = db.Column(db.ARRAY(db.String(120)))
+    # Denormalised show counters, see recount_shows() and refresh_show_counts()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', cascade = "all, delete", back_populates="venue")
+    __table_args__ = (
+        Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # /venues lists venues ordered by area
+        Index('ix_Venue_city_state_name', 'city', 'state', 'name'),
+    )
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
@@ -40,7 +47,12 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String(120), default="")
     genres = db.Column(db.ARRAY(db.String(120)))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', cascade = "all, delete", back_populates="artist")
+    __table_args__ = (
+        Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
 class Show(db.Model):
     __tablename__ = 'Show'
@@ -50,4 +62,88 @@ class Show(db.Model):
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     start_time = db.Column(db.DateTime(timezone=True), nullable=False)
     venue = db.relationship("Venue", back_populates="shows")
-    artist = db.relationship("Artist", back_populates="shows")
\ No newline at end of file
+    artist = db.relationship("Artist", back_populates="shows")
+    __table_args__ = (
+        # Detail pages, counters and deletes look shows up by venue or artist
+        # and order them by start_time
+        Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        # /shows keyset pagination
+        Index('ix_Show_start_time_id', 'start_time', 'id'),
+    )
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry upcoming_shows_count/past_shows_count so listings and
+# searches read one integer per row. Shows written through the ORM recount
+# their venue and artist in the same transaction; bulk deletes call
+# recount_shows() themselves. refresh_show_counts() recomputes every counter
+# and moves shows whose start_time has passed from upcoming to past. Run it
+# periodically, e.g. from cron:
+#   */5 * * * *  FLASK_APP=app flask refresh-show-counts
+#----------------------------------------------------------------------------#
+
+def recount_shows(bind, venue_ids=(), artist_ids=()):
+    # Counts the shows of the given venues and artists afresh rather than
+    # adding or subtracting one: a show counted as upcoming may have started
+    # by the time it is deleted. Each count is a range scan of the
+    # (venue_id|artist_id, start_time) index.
+    upcoming = Show.start_time > func.now()
+    for model, owner_column, ids in ((Venue, Show.venue_id, venue_ids), (Artist, Show.artist_id, artist_ids)):
+        ids = list(ids)
+        if not ids:
+            continue
+        shows = select([func.count(Show.id)]).where(owner_column == model.id)
+        bind.execute(model.__table__.update().where(model.id.in_(ids)).values(
+            upcoming_shows_count=shows.where(upcoming).as_scalar(),
+            past_shows_count=shows.where(not_(upcoming)).as_scalar()
+        ))
+
+@event.listens_for(Show, 'after_insert')
+@event.listens_for(Show, 'after_delete')
+def show_written(mapper, connection, target):
+    recount_shows(connection, [target.venue_id], [target.artist_id])
+
+def grouped_show_counts(owner_column, *criteria):
+    upcoming = Show.start_time > func.now()
+    return select([
+        owner_column.label('owner_id'),
+        func.count(Show.id).filter(upcoming).label('upcoming'),
+        func.count(Show.id).filter(not_(upcoming)).label('past')
+    ]).where(and_(*criteria)).group_by(owner_column).alias('counts')
+
+def refresh_show_counts(bind):
+    # Two set-based statements per table; only rows whose counters actually
+    # change are written. Returns the ids that changed, by 'venue'/'artist'.
+    changed = {}
+    for model, owner_column in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        counts = grouped_show_counts(owner_column)
+        ids = set(row[0] for row in bind.execute(model.__table__.update().where(and_(
+            model.id == counts.c.owner_id,
+            or_(model.upcoming_shows_count != counts.c.upcoming, model.past_shows_count != counts.c.past)
+        )).values(upcoming_shows_count=counts.c.upcoming, past_shows_count=counts.c.past).returning(model.id)))
+        ids.update(row[0] for row in bind.execute(model.__table__.update().where(and_(
+            or_(model.upcoming_shows_count != 0, model.past_shows_count != 0),
+            ~exists().where(owner_column == model.id)
+        )).values(upcoming_shows_count=0, past_shows_count=0).returning(model.id)))
+        changed[model.__tablename__.lower()] = ids
+    return changed
+
+def invalidate_show_counts(changed):
+    # The cached pages showing the counters, or the upcoming/past split, of
+    # the venues and artists refresh_show_counts() changed.
+    tags = ['{0}:{1}'.format(kind, owner_id) for kind, ids in sorted(changed.items()) for owner_id in sorted(ids)]
+    if changed.get('venue'):
+        tags.append('venues')
+    if tags:
+        page_cache.invalidate(*tags)
+
+@app.cli.command('refresh-show-counts')
+def refresh_show_counts_command():
+    """Recompute the upcoming/past show counters of every venue and artist."""
+    changed = refresh_show_counts(db.session)
+    db.session.commit()
+    invalidate_show_counts(changed)
+    click.echo('Show counters refreshed ({0} venues, {1} artists changed).'.format(
+        len(changed['venue']), len(changed['artist'])))
@@ -0,0 +1,51 @@
+#----------------------------------------------------------------------------#
+# Connection pool.
+#
+# QueuePool that also records how long each checkout took: the time spent
+# waiting for a free connection plus, when the pool grows, the time to open
+# a new one. Exposed through /stats/pool.
+#----------------------------------------------------------------------------#
+
+import time
+import threading
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError
+
+
+class TimedQueuePool(QueuePool):
+
+  def __init__(self, *args, **kwargs):
+    super(TimedQueuePool, self).__init__(*args, **kwargs)
+    self._stats_lock = threading.Lock()
+    self._checkouts = 0
+    self._timeouts = 0
+    self._wait_total = 0.0
+    self._wait_max = 0.0
+
+  def _do_get(self):
+    started = time.time()
+    try:
+      return super(TimedQueuePool, self)._do_get()
+    except TimeoutError:
+      with self._stats_lock:
+        self._timeouts += 1
+      raise
+    finally:
+      waited = time.time() - started
+      with self._stats_lock:
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+  def stats(self):
+    with self._stats_lock:
+      return {
+        "size": self.size(),
+        "checked_in": self.checkedin(),
+        "checked_out": self.checkedout(),
+        "overflow": self.overflow(),
+        "checkouts": self._checkouts,
+        "timeouts": self._timeouts,
+        "wait_avg_ms": 1000.0 * self._wait_total / self._checkouts if self._checkouts else 0.0,
+        "wait_max_ms": 1000.0 * self._wait_max
+      }
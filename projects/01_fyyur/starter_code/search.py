@@ -0,0 +1,86 @@
+#----------------------------------------------------------------------------#
+# Search.
+#
+# Venue, artist and show search backed by the pg_trgm GIN indexes on
+# Venue.name and Artist.name. Every search is one statement: matches are
+# ranked by trigram similarity, paginated with LIMIT/OFFSET, and the total
+# number of matches rides along on each row as a count(*) OVER () window.
+#----------------------------------------------------------------------------#
+
+from sqlalchemy import func, or_, select
+from models import db, Venue, Artist, Show
+
+RESULTS_PER_PAGE = 10
+
+
+def like_pattern(term):
+  # Escapes LIKE wildcards so the term is matched literally as a substring.
+  escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  return '%{0}%'.format(escaped)
+
+
+def paginate(query, page, per_page=RESULTS_PER_PAGE):
+  page = max(page, 1)
+  total = func.count().over().label('total')
+  rows = query.add_columns(total).limit(per_page).offset((page - 1) * per_page).all()
+  if rows:
+    count = rows[0].total
+  elif page > 1:
+    # Past the last page there is no row to carry the window count.
+    count = query.order_by(None).count()
+  else:
+    count = 0
+
+  data = []
+  for row in rows:
+    result = row._asdict()
+    del result['total']
+    data.append(result)
+
+  return {
+    "count": count,
+    "data": data,
+    "page": page,
+    "pages": -(-count // per_page)
+  }
+
+
+def venues(term, page=1):
+  query = db.session.query(
+    Venue.id,
+    Venue.name,
+    Venue.upcoming_shows_count.label('num_upcoming_shows')
+  ).filter(Venue.name.ilike(like_pattern(term))) \
+    .order_by(func.similarity(Venue.name, term).desc(), Venue.name)
+  return paginate(query, page)
+
+
+def artists(term, page=1):
+  query = db.session.query(
+    Artist.id,
+    Artist.name,
+    Artist.upcoming_shows_count.label('num_upcoming_shows')
+  ).filter(Artist.name.ilike(like_pattern(term))) \
+    .order_by(func.similarity(Artist.name, term).desc(), Artist.name)
+  return paginate(query, page)
+
+
+def shows(term, page=1):
+  pattern = like_pattern(term)
+  # An ILIKE spanning both joined tables could only be checked show by show;
+  # matching venues and artists first keeps each name lookup on its trigram
+  # index, and the shows of those ids come from the Show indexes.
+  venue_ids = select([Venue.id]).where(Venue.name.ilike(pattern))
+  artist_ids = select([Artist.id]).where(Artist.name.ilike(pattern))
+  rank = func.greatest(func.similarity(Venue.name, term), func.similarity(Artist.name, term))
+  query = db.session.query(
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Show.start_time
+  ).select_from(Show).join(Venue, Show.venue).join(Artist, Show.artist) \
+    .filter(or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids))) \
+    .order_by(rank.desc(), Show.start_time)
+  return paginate(query, page)
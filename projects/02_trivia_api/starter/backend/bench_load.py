@@ -0,0 +1,186 @@
+'''
+Load benchmark for the trivia API.
+
+For every table size asked for, seeds a scratch database with synthetic
+questions (see bench_quiz.seed) and drives the read endpoints with a pool
+of concurrent clients, once through Flask's test client and once over HTTP
+against a threaded werkzeug server. Latency percentiles and throughput per
+endpoint are written as JSON, so runs on different commits can be diffed.
+
+    python bench_load.py --sizes 10000 100000 1000000 --clients 8 --output load.json
+
+The questions and categories tables in the target database are DROPPED and
+recreated.
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from flaskr import create_app
+from models import db
+from bench_quiz import seed, CATEGORIES
+
+QUESTIONS_PER_PAGE = 10
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+  # One log line per request would dominate the run.
+  def log_request(self, *args, **kwargs):
+    pass
+
+
+def endpoints(size):
+  # name -> function returning (method, path, json body) for one request.
+  pages = max(size // QUESTIONS_PER_PAGE, 1)
+  return {
+    'questions_page': lambda: ('GET', '/api/questions?page={}'.format(random.randint(1, min(pages, 100))), None),
+    'questions_deep_page': lambda: ('GET', '/api/questions?page={}'.format(random.randint(1, pages)), None),
+    'category_questions': lambda: ('GET', '/api/categories/{}/questions'.format(random.randint(1, CATEGORIES)), None),
+    'search': lambda: ('POST', '/api/questions', {'searchTerm': 'Question {}'.format(random.randint(1, size))}),
+    'quiz': lambda: ('POST', '/api/quizzes', {
+      'previous_questions': random.sample(range(1, size + 1), 5),
+      'quiz_category': {'type': '', 'id': random.randint(0, CATEGORIES)}
+    })
+  }
+
+
+def test_client_driver(app):
+  local = threading.local()
+
+  def send(method, path, body):
+    if not hasattr(local, 'client'):
+      local.client = app.test_client()
+    response = local.client.open(path, method=method, json=body)
+    return response.status_code
+  return send
+
+
+def server_driver(base_url):
+  def send(method, path, body):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+    try:
+      with urllib.request.urlopen(request) as response:
+        response.read()
+        return response.status
+    except urllib.error.HTTPError as e:
+      return e.code
+  return send
+
+
+def percentile(ordered, percent):
+  # Nearest-rank percentile of an already sorted list.
+  if not ordered:
+    return None
+  rank = max(int(round(percent / 100.0 * len(ordered))) - 1, 0)
+  return ordered[min(rank, len(ordered) - 1)]
+
+
+def run(send, make_request, requests, clients):
+  latencies = []
+  errors = [0]
+  lock = threading.Lock()
+  remaining = [requests]
+
+  def client():
+    while True:
+      with lock:
+        if not remaining[0]:
+          return
+        remaining[0] -= 1
+      method, path, body = make_request()
+      started = time.perf_counter()
+      status = send(method, path, body)
+      elapsed = time.perf_counter() - started
+      with lock:
+        latencies.append(elapsed)
+        if status >= 500:
+          errors[0] += 1
+
+  started = time.perf_counter()
+  threads = [threading.Thread(target=client) for _ in range(clients)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - started
+
+  latencies.sort()
+  return {
+    'requests': len(latencies),
+    'errors': errors[0],
+    'p50_ms': round(1000 * percentile(latencies, 50), 3),
+    'p95_ms': round(1000 * percentile(latencies, 95), 3),
+    'p99_ms': round(1000 * percentile(latencies, 99), 3),
+    'throughput_rps': round(len(latencies) / elapsed, 1)
+  }
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                   stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Load benchmark for the trivia API.')
+  parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL', 'postgresql://postgres@localhost:5432/trivia_bench'))
+  parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+  parser.add_argument('--clients', type=int, default=8)
+  parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and driver.')
+  parser.add_argument('--drivers', nargs='+', choices=['test_client', 'server'], default=['test_client', 'server'])
+  parser.add_argument('--endpoints', nargs='+', help='Only run these endpoints.')
+  parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+  args = parser.parse_args()
+
+  app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+  server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  drivers = {
+    'test_client': test_client_driver(app),
+    'server': server_driver('http://127.0.0.1:{}'.format(server.server_port))
+  }
+
+  results = []
+  for size in args.sizes:
+    print('Seeding {} questions...'.format(size), file=sys.stderr)
+    with app.app_context():
+      seed(size)
+      db.session.remove()
+    for name, make_request in sorted(endpoints(size).items()):
+      if args.endpoints and name not in args.endpoints:
+        continue
+      for driver in args.drivers:
+        result = run(drivers[driver], make_request, args.requests, args.clients)
+        result.update({'size': size, 'endpoint': name, 'driver': driver})
+        results.append(result)
+        print('{size:>8} {endpoint:<20} {driver:<12} p50 {p50_ms:>8.2f}ms  p95 {p95_ms:>8.2f}ms  '
+              'p99 {p99_ms:>8.2f}ms  {throughput_rps:>8.1f} req/s  {errors} errors'.format(**result), file=sys.stderr)
+  server.shutdown()
+
+  report = json.dumps({
+    'commit': git_commit(),
+    'database': app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+    'clients': args.clients,
+    'results': results
+  }, indent=2)
+  if args.output:
+    with open(args.output, 'w') as output:
+      output.write(report + '\n')
+  else:
+    print(report)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,94 @@
+'''
+Quiz sampling benchmark.
+
+Seeds a scratch database with synthetic questions and times one quiz step,
+picking a random unplayed question, both with the old ORDER BY random()
+query and with flaskr.sampling.random_question, for quiz sessions of
+growing length, with and without a category.
+
+    python bench_quiz.py --database-url postgresql://postgres@localhost:5432/trivia_bench
+
+The questions and categories tables in the target database are DROPPED and
+recreated.
+'''
+import os
+import time
+import random
+import argparse
+import statistics
+from flask import Flask
+from sqlalchemy import func, text
+
+from models import setup_db, db, Question, Category, refresh_question_counts
+from flaskr.sampling import random_question
+
+CATEGORIES = 6
+
+
+def legacy_random_question(previous_questions=(), category_id=None):
+  # The query /api/quizzes ran before flaskr.sampling.
+  selection = Question.query.filter(Question.id.notin_(previous_questions)).order_by(func.random())
+  if category_id is not None:
+    selection = selection.filter(Question.category == category_id)
+  return selection.first()
+
+
+def seed(questions):
+  db.drop_all()
+  db.create_all()
+  db.session.add_all([Category(type='Category {}'.format(i)) for i in range(1, CATEGORIES + 1)])
+  db.session.flush()
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute(text('''
+      INSERT INTO questions (question, answer, category, difficulty)
+      SELECT 'Question ' || i, 'Answer ' || i, 1 + i % :categories, 1 + i % 5
+      FROM generate_series(1, :questions) AS i'''), {'questions': questions, 'categories': CATEGORIES})
+  else:
+    db.session.execute(Question.__table__.insert(), [
+      {'question': 'Question {}'.format(i), 'answer': 'Answer {}'.format(i),
+       'category': 1 + i % CATEGORIES, 'difficulty': 1 + i % 5}
+      for i in range(1, questions + 1)])
+  refresh_question_counts(db.session)
+  db.session.commit()
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute(text('ANALYZE questions'))
+    db.session.commit()
+
+
+def time_step(sample, played, category_id, repeat):
+  timings = []
+  for _ in range(repeat):
+    started = time.perf_counter()
+    sample(played, category_id)
+    timings.append(1000 * (time.perf_counter() - started))
+    db.session.rollback()
+  return statistics.median(timings)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark random quiz question selection.')
+  parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL', 'postgresql://postgres@localhost:5432/trivia_bench'))
+  parser.add_argument('--questions', type=int, default=1000000)
+  parser.add_argument('--played', type=int, nargs='+', default=[0, 10, 100, 1000])
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  app = Flask(__name__)
+  setup_db(app, args.database_url)
+  with app.app_context():
+    print('Seeding {} questions...'.format(args.questions))
+    seed(args.questions)
+    ids = [question_id for question_id, in db.session.query(Question.id)]
+
+    print('{:<10} {:>7} {:>14} {:>14} {:>9}'.format('category', 'played', 'random() ms', 'sampling ms', 'speedup'))
+    for category_id in (None, 1):
+      for played in args.played:
+        previous_questions = random.sample(ids, played)
+        before = time_step(legacy_random_question, previous_questions, category_id, args.repeat)
+        after = time_step(random_question, previous_questions, category_id, args.repeat)
+        print('{:<10} {:>7} {:>14.3f} {:>14.3f} {:>8.1f}x'.format(
+          'all' if category_id is None else category_id, played, before, after, before / after))
+
+
+if __name__ == '__main__':
+  main()
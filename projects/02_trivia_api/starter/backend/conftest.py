@@ -0,0 +1,167 @@
+"""
+Test harness for the trivia backend.
+
+One app and one database per test session: the schema is created once and
+seeded from the COPY blocks of trivia.psql. Every test then runs inside a
+transaction on a single connection that is rolled back when the test ends;
+the application's own commits only release SAVEPOINTs within it, so tests
+never see each other's writes.
+
+The database is an in-memory SQLite one unless TRIVIA_TEST_DATABASE_URL
+points somewhere else, e.g.
+
+    TRIVIA_TEST_DATABASE_URL=postgresql://postgres@localhost:5432/trivia_test python -m pytest
+
+Under pytest-xdist (python -m pytest -n 4) every worker gets a database of
+its own: SQLite ones are per process anyway, PostgreSQL ones get the worker
+id appended to their name and are created when missing.
+"""
+import os
+import re
+import pytest
+from sqlalchemy import Integer, create_engine, event, text
+from sqlalchemy.engine.url import make_url
+
+from flaskr import create_app, categories
+from models import db, Question, Category, refresh_question_counts
+
+TRIVIA_PSQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trivia.psql')
+
+COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v', '\\': '\\'}
+
+
+def database_url():
+    url = make_url(os.environ.get('TRIVIA_TEST_DATABASE_URL', 'sqlite://'))
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    if worker and url.get_backend_name() != 'sqlite':
+        url.database = '{}_{}'.format(url.database, worker)
+    return url
+
+
+def create_database(url):
+    if url.get_backend_name() != 'postgresql':
+        return
+    server = make_url(str(url))
+    server.database = 'postgres'
+    engine = create_engine(server, isolation_level='AUTOCOMMIT')
+    with engine.connect() as connection:
+        exists = connection.execute(text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                                    name=url.database).scalar()
+        if not exists:
+            # trivia.psql is UTF-8, whatever the server's default encoding.
+            connection.execute('CREATE DATABASE "{}" ENCODING \'UTF8\' TEMPLATE template0'.format(url.database))
+    engine.dispose()
+
+
+def enable_sqlite_savepoints(engine):
+    # pysqlite issues BEGIN (and COMMIT) on its own terms, which breaks
+    # SAVEPOINT; leave transaction control to SQLAlchemy instead.
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.execute('BEGIN')
+
+
+def copy_value(value):
+    if value == '\\N':
+        return None
+    return re.sub(r'\\(.)', lambda match: COPY_ESCAPES.get(match.group(1), match.group(1)), value)
+
+
+def psql_rows(path):
+    # {table name: [row dicts]} read from the COPY ... FROM stdin blocks of a
+    # pg_dump file, so the tests run against the same data as the app.
+    tables = {}
+    with open(path, encoding='utf-8') as dump:
+        lines = iter(dump)
+        for line in lines:
+            match = re.match(r'COPY public\.(\w+) \((.*)\) FROM stdin;', line)
+            if not match:
+                continue
+            columns = [column.strip() for column in match.group(2).split(',')]
+            rows = tables.setdefault(match.group(1), [])
+            for line in lines:
+                line = line.rstrip('\n')
+                if line == '\\.':
+                    break
+                rows.append(dict(zip(columns, (copy_value(value) for value in line.split('\t')))))
+    return tables
+
+
+def seed(path=TRIVIA_PSQL):
+    tables = psql_rows(path)
+    for model in (Category, Question):
+        table = model.__table__
+        rows = [
+            dict((name, int(value) if value is not None and isinstance(table.c[name].type, Integer) else value)
+                 for name, value in row.items())
+            for row in tables[table.name]
+        ]
+        db.session.execute(table.insert(), rows)
+        if db.engine.dialect.name == 'postgresql':
+            # Explicit ids leave the sequence behind.
+            db.session.execute(text("SELECT setval(pg_get_serial_sequence(:table, 'id'), max(id)) FROM {}"
+                                    .format(table.name)), {'table': table.name})
+    refresh_question_counts(db.session)
+    db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app():
+    url = database_url()
+    create_database(url)
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': str(url)
+    })
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            enable_sqlite_savepoints(db.engine)
+            # Start over on a connection that has the listeners.
+            db.engine.dispose()
+        db.drop_all()
+        db.create_all()
+        seed()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def transaction(app, request):
+    connection = db.engine.connect()
+    outer = connection.begin()
+    session = db.create_scoped_session(options={'bind': connection, 'binds': {}})
+    session.begin_nested()
+
+    @event.listens_for(session, 'after_transaction_end')
+    def restart_savepoint(db_session, transaction):
+        if transaction.nested and not transaction._parent.nested:
+            db_session.expire_all()
+            db_session.begin_nested()
+
+    # Flask-SQLAlchemy removes the session after every request, which would
+    # drop the savepoint with it; clearing it keeps requests apart just as well.
+    session.remove = session.expunge_all
+    app_session, db.session = db.session, session
+    if request.instance is not None:
+        request.instance.app = app
+        request.instance.client = app.test_client
+        request.instance.db = db
+
+    yield session
+
+    db.session = app_session
+    event.remove(session, 'after_transaction_end', restart_savepoint)
+    # Rolling the session back unwinds its SAVEPOINT before the outer
+    # transaction goes; closing it alone would leave the SAVEPOINT current.
+    session.registry().rollback()
+    session.registry().close()
+    outer.rollback()
+    connection.close()
+    # The categories cache may hold rows that were just rolled back.
+    categories.invalidate()
@@ -1,28 +1,73 @@
 import os
-from flask import Flask, request, abort, jsonify
+import base64
+import binascii
+from flask import Flask, Response, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from models import setup_db, database_path, db, Question, Category
+from .sampling import random_question
+from .categories import CategoryCache, CATEGORY_CACHE_TTL
+from .search import search_questions
+from .batch import MAX_BATCH_SIZE, existing_category_ids, validate_question, insert_questions, delete_questions
+from .export import export_lines, export_questions_command
+from .quiz_sessions import QUIZ_LENGTH, quiz_session_store, draw_question_ids
 
 QUESTIONS_PER_PAGE = 10
 
-def paginate_questions(request, selection):
-	page = request.args.get('page', 1, type=int)
-	start =  (page - 1) * QUESTIONS_PER_PAGE
-	end = start + QUESTIONS_PER_PAGE
+# Above this many rows the unfiltered question count is read from the
+# planner's statistics instead of counting the table.
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+def encode_cursor(question_id):
+	return base64.urlsafe_b64encode(str(question_id).encode()).decode()
 
-	questions = [question.format() for question in selection]
-	current_questions = questions[start:end]
+def decode_cursor(cursor):
+	try:
+		return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+	except (binascii.Error, UnicodeError, ValueError):
+		abort(400)
 
-	return current_questions
+def paginate_questions(request, selection):
+	# Pages through an id-ordered selection query in the database. ?page=N
+	# uses LIMIT/OFFSET; ?cursor= resumes after the last question of a
+	# previous page (keyset paging on id), which costs the same at any depth.
+	# Returns the page and the cursor of the next one (None on the last page).
+	cursor = request.args.get('cursor', None)
+	if cursor is not None:
+		selection = selection.filter(Question.id > decode_cursor(cursor))
+	else:
+		page = max(request.args.get('page', 1, type=int), 1)
+		selection = selection.offset((page - 1) * QUESTIONS_PER_PAGE)
+
+	# One row past the page tells whether there is a next page.
+	questions = selection.limit(QUESTIONS_PER_PAGE + 1).all()
+	next_cursor = None
+	if len(questions) > QUESTIONS_PER_PAGE:
+		questions = questions[:QUESTIONS_PER_PAGE]
+		next_cursor = encode_cursor(questions[-1].id)
+
+	return [question.format() for question in questions], next_cursor
+
+def estimate_question_count():
+	# reltuples is only as fresh as the last ANALYZE, so small tables, where
+	# counting is cheap anyway, are always counted exactly.
+	if db.engine.dialect.name == 'postgresql':
+		estimate = db.session.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'questions'::regclass").scalar()
+		if estimate >= COUNT_ESTIMATE_THRESHOLD:
+			return estimate
+	return Question.query.count()
 
 def create_app(test_config=None):
 	# create and configure the app
 	app = Flask(__name__)
-	setup_db(app)
+	if test_config is not None:
+		app.config.from_mapping(test_config)
+	setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+	category_cache = CategoryCache(app.config.get('CATEGORY_CACHE_TTL', CATEGORY_CACHE_TTL))
+	quiz_sessions = quiz_session_store(app.config)
+	app.cli.add_command(export_questions_command)
 	cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 	# CORS Headers 
@@ -34,20 +79,21 @@ def create_app(test_config=None):
 
 	@app.route('/api/categories/', methods=['GET'])
 	def retrieve_categories():
-		categories = Category.query.order_by(Category.id).all()
-		formatted_categories = [category.format() for category in categories]
-
-		return jsonify({
-			'success': True,
-			'categories': formatted_categories
-		})
+		catalogue = category_cache.get()
+		if request.if_none_match.contains(catalogue.etag):
+			response = Response(status=304)
+		else:
+			response = Response(catalogue.body, mimetype='application/json')
+		response.set_etag(catalogue.etag)
+		# Clients may keep the list but have to revalidate it.
+		response.cache_control.no_cache = True
+		return response
 
 	@app.route('/api/questions', methods=['GET'])
 	def retrieve_questions():
-		selection = Question.query.order_by(Question.id).all()
-		current_questions = paginate_questions(request, selection)
-		categories = Category.query.order_by(Category.id).all()
-		formatted_categories = [category.format() for category in categories]
+		selection = Question.query.order_by(Question.id)
+		current_questions, next_cursor = paginate_questions(request, selection)
+		formatted_categories = category_cache.get().categories
 
 		# https://stackoverflow.com/questions/7961363/removing-duplicates-in-lists
 		current_list = list(set([question['category'] for question in current_questions]))
@@ -58,11 +104,23 @@ def create_app(test_config=None):
 		return jsonify({
 			'success': True,
 			'questions': current_questions,
-			'total_questions': len(selection),
+			'total_questions': estimate_question_count(),
+			'next_cursor': next_cursor,
 			'categories': formatted_categories,
 			'current_category': current_list
 		})
 
+	@app.route('/api/questions/export', methods=['GET'])
+	def export_questions():
+		# Streams the whole (optionally filtered) question bank as NDJSON; rows
+		# are read through a server-side cursor as the response is written.
+		category = request.args.get('category', None, type=int)
+		difficulty = request.args.get('difficulty', None, type=int)
+		response = Response(stream_with_context(export_lines(category, difficulty)),
+			mimetype='application/x-ndjson')
+		response.headers['Content-Disposition'] = 'attachment; filename=questions.ndjson'
+		return response
+
 	@app.route('/api/questions/<int:question_id>', methods=['DELETE'])
 	def delete_question(question_id):
 		try:
@@ -89,13 +147,13 @@ def create_app(test_config=None):
 
 		try:
 			if search:
-				selection = Question.query.order_by(Question.id).filter(Question.question.ilike('%{}%'.format(search)))
-				current_questions = paginate_questions(request, selection)
+				page = request.args.get('page', 1, type=int)
+				current_questions, total_questions = search_questions(search, page, QUESTIONS_PER_PAGE)
 
 				return jsonify({
 					'success': True,
 					'questions': current_questions,
-					'total_questions': len(selection.all())
+					'total_questions': total_questions
 				})
 
 			else:
@@ -110,10 +168,74 @@ def create_app(test_config=None):
 		except:
 			abort(422)
 
+	def batch_items():
+		items = request.get_json(silent=True)
+		if not isinstance(items, list) or not items:
+			abort(400)
+		if len(items) > MAX_BATCH_SIZE:
+			abort(413)
+		return items
+
+	@app.route('/api/questions/batch', methods=['POST'])
+	def create_questions_batch():
+		# All or nothing: the pack is validated up front and, if every item is
+		# valid, written in one transaction. Results are per item, in order.
+		items = batch_items()
+		category_ids = existing_category_ids(items)
+
+		mappings = []
+		errors = []
+		for index, item in enumerate(items):
+			mapping, error = validate_question(item, category_ids)
+			if error:
+				errors.append({'index': index, 'error': error})
+			else:
+				mappings.append(mapping)
+
+		if errors:
+			return jsonify({
+				'success': False,
+				'error': 422,
+				'message': 'unprocessable',
+				'results': errors
+			}), 422
+
+		try:
+			ids = insert_questions(mappings)
+			db.session.commit()
+		except:
+			db.session.rollback()
+			abort(422)
+
+		return jsonify({
+			'success': True,
+			'created': len(ids),
+			'results': [{'index': index, 'id': question_id} for index, question_id in enumerate(ids)]
+		})
+
+	@app.route('/api/questions/batch', methods=['DELETE'])
+	def delete_questions_batch():
+		question_ids = batch_items()
+		if not all(isinstance(question_id, int) and not isinstance(question_id, bool) for question_id in question_ids):
+			abort(400)
+
+		try:
+			deleted = delete_questions(question_ids)
+			db.session.commit()
+		except:
+			db.session.rollback()
+			abort(422)
+
+		return jsonify({
+			'success': True,
+			'deleted': len(deleted),
+			'results': [{'id': question_id, 'deleted': question_id in deleted} for question_id in question_ids]
+		})
+
 	@app.route('/api/categories/<int:category_id>/questions', methods=['GET'])
 	def retrieve_questions_by_category(category_id):
-		selection = Question.query.order_by(Question.id).filter(Question.category == category_id).all()
-		current_questions = paginate_questions(request, selection)
+		selection = Question.query.order_by(Question.id).filter(Question.category == category_id)
+		current_questions, next_cursor = paginate_questions(request, selection)
 
 		if len(current_questions) == 0:
 			abort(404)
@@ -121,7 +243,8 @@ def create_app(test_config=None):
 		return jsonify({
 			'success': True,
 			'questions': current_questions,
-			'total_questions': len(selection),
+			'total_questions': db.session.query(Category.question_count).filter(Category.id == category_id).scalar(),
+			'next_cursor': next_cursor,
 			'current_category': category_id
 		})
 
@@ -131,23 +254,38 @@ def create_app(test_config=None):
 
 		previous_questions = body.get('previous_questions', [])
 		quiz_category = body.get('quiz_category', None)
-		selection = Question.query.filter(Question.id.notin_(previous_questions)).order_by(func.random())
-
+		category_id = None
 		if quiz_category is not None and quiz_category['id'] > 0:
-			selection = selection.filter(Question.category == quiz_category['id'])
-
-		selection = selection.first()
-
-		if not selection:
-			return jsonify({
-					'success': False,
-					'question': False
-				})
-
-		return jsonify({
-			'success': True,
-			'question': selection.format()
-		})
+			category_id = quiz_category['id']
+
+		if 'quiz_session' not in body:
+			# Clients that keep track of previous_questions themselves.
+			selection = random_question(previous_questions, category_id)
+		else:
+			# Quiz sessions: the first request (quiz_session null) draws the
+			# whole quiz server side, later ones only send the id.
+			quiz_session = body['quiz_session']
+			if quiz_session is None:
+				quiz_session = quiz_sessions.create(draw_question_ids(category_id, previous_questions,
+					app.config.get('QUIZ_LENGTH', QUIZ_LENGTH)))
+			selection = None
+			try:
+				# Skips questions deleted since the quiz was drawn.
+				question_id = quiz_sessions.pop(quiz_session)
+				while question_id is not None and selection is None:
+					selection = Question.query.get(question_id)
+					if selection is None:
+						question_id = quiz_sessions.pop(quiz_session)
+			except KeyError:
+				abort(404)
+
+		response = {
+			'success': selection is not None,
+			'question': selection.format() if selection is not None else False
+		}
+		if 'quiz_session' in body:
+			response['quiz_session'] = quiz_session
+		return jsonify(response)
 
 	@app.errorhandler(400)
 	def bad_request(error):
@@ -165,6 +303,14 @@ def create_app(test_config=None):
 			"message": "resource not found"
 			}), 404
 
+	@app.errorhandler(413)
+	def too_large(error):
+		return jsonify({
+			"success": False,
+			"error": 413,
+			"message": "too many items, at most {} per request".format(MAX_BATCH_SIZE)
+			}), 413
+
 	@app.errorhandler(422)
 	def unprocessable(error):
 		return jsonify({
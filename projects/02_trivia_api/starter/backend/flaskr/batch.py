@@ -0,0 +1,74 @@
+from collections import Counter
+
+from models import db, Question, Category, adjust_question_counts
+
+# Largest question pack accepted by one batch request.
+MAX_BATCH_SIZE = 10000
+
+# Rows per INSERT/DELETE statement; keeps statements and bind lists bounded.
+CHUNK_SIZE = 1000
+
+def chunks(items, size=CHUNK_SIZE):
+	for start in range(0, len(items), size):
+		yield items[start:start + size]
+
+def existing_category_ids(items):
+	# The categories the items refer to that exist, read from the database
+	# rather than a cache so a category added anywhere is accepted right away.
+	referenced = set(item['category'] for item in items
+		if isinstance(item, dict) and isinstance(item.get('category'), int) and not isinstance(item['category'], bool))
+	if not referenced:
+		return set()
+	return set(category_id for category_id, in db.session.query(Category.id).filter(Category.id.in_(referenced)))
+
+def validate_question(item, category_ids):
+	# Returns (mapping, None) for a valid question and (None, error) otherwise.
+	if not isinstance(item, dict):
+		return None, 'expected an object'
+	for field in ('question', 'answer'):
+		value = item.get(field)
+		if not isinstance(value, str) or not value.strip():
+			return None, '{} is required'.format(field)
+	difficulty = item.get('difficulty')
+	if isinstance(difficulty, bool) or not isinstance(difficulty, int) or not 1 <= difficulty <= 5:
+		return None, 'difficulty must be an integer from 1 to 5'
+	category = item.get('category')
+	if isinstance(category, bool) or not isinstance(category, int) or category not in category_ids:
+		return None, 'category must be the id of an existing category'
+	return {
+		'question': item['question'],
+		'answer': item['answer'],
+		'difficulty': difficulty,
+		'category': category
+	}, None
+
+def insert_questions(mappings):
+	# Returns the new ids, in the order of mappings. Runs in the session's
+	# transaction; the caller commits. Bulk writes skip the ORM events, so
+	# the category counters are adjusted here, once per category.
+	adjust_question_counts(db.session, Counter(mapping['category'] for mapping in mappings))
+	if db.engine.dialect.name == 'postgresql':
+		ids = []
+		table = Question.__table__
+		for chunk in chunks(mappings):
+			# One multi-row INSERT ... RETURNING per chunk.
+			result = db.session.execute(table.insert().values(chunk).returning(table.c.id))
+			ids.extend(question_id for question_id, in result)
+		return ids
+
+	db.session.bulk_insert_mappings(Question, mappings, return_defaults=True)
+	return [mapping['id'] for mapping in mappings]
+
+def delete_questions(question_ids):
+	# Returns the subset of question_ids that existed and were deleted.
+	deleted = set()
+	removed = Counter()
+	for chunk in chunks(question_ids):
+		existing = db.session.query(Question.id, Question.category).filter(Question.id.in_(chunk)).all()
+		if existing:
+			Question.query.filter(Question.id.in_([question_id for question_id, _ in existing])) \
+				.delete(synchronize_session=False)
+			deleted.update(question_id for question_id, _ in existing)
+			removed.update(category_id for _, category_id in existing)
+	adjust_question_counts(db.session, dict((category_id, -count) for category_id, count in removed.items()))
+	return deleted
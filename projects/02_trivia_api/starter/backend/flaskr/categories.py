@@ -0,0 +1,79 @@
+import json
+import time
+import hashlib
+import threading
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import Category
+
+Catalogue = namedtuple('Catalogue', ['version', 'expires', 'categories', 'body', 'etag'])
+
+# Seconds a catalogue is served before it is rebuilt even without a write
+# from this process. The API itself never writes categories, so this is what
+# brings in changes made by other processes or straight in the database.
+CATEGORY_CACHE_TTL = 60
+
+# Bumped every time a transaction that wrote a category commits. Caches
+# compare it with the version they were built at, so a write anywhere in
+# the process invalidates every app's cache at once.
+_version = 0
+
+def version():
+	return _version
+
+def invalidate():
+	global _version
+	_version += 1
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def category_written(mapper, connection, target):
+	object_session(target).info['categories_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def categories_committed(session):
+	# Invalidating at commit rather than at flush keeps a concurrent rebuild
+	# from caching the old rows under the new version.
+	if session.info.pop('categories_changed', False):
+		invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def categories_rolled_back(session):
+	session.info.pop('categories_changed', None)
+
+
+class CategoryCache(object):
+	# The formatted category list plus the serialized GET /api/categories/
+	# body and its ETag, built on first use and rebuilt once the version moves
+	# or the TTL runs out. An unchanged rebuild keeps the same ETag.
+
+	def __init__(self, ttl=CATEGORY_CACHE_TTL):
+		self.ttl = ttl
+		self._lock = threading.Lock()
+		self._catalogue = None
+
+	def get(self):
+		catalogue = self._catalogue
+		if not self._fresh(catalogue):
+			with self._lock:
+				catalogue = self._catalogue
+				if not self._fresh(catalogue):
+					catalogue = self._catalogue = self._build()
+		return catalogue
+
+	def _fresh(self, catalogue):
+		return catalogue is not None and catalogue.version == version() and catalogue.expires > time.monotonic()
+
+	def _build(self):
+		# Read the version first: a write that lands during the query leaves
+		# the catalogue behind the version, so the next get() rebuilds it.
+		built_at = version()
+		categories = [category.format() for category in Category.query.order_by(Category.id).all()]
+		body = json.dumps({
+			'success': True,
+			'categories': categories
+		}).encode('utf-8')
+		return Catalogue(built_at, time.monotonic() + self.ttl, categories, body, hashlib.sha1(body).hexdigest())
@@ -0,0 +1,45 @@
+import json
+import click
+from flask.cli import with_appcontext
+
+from models import db, Question
+
+# Rows fetched from the server-side cursor per round trip.
+EXPORT_CHUNK_SIZE = 1000
+
+def export_query(category=None, difficulty=None):
+	selection = db.session.query(
+		Question.id,
+		Question.question,
+		Question.answer,
+		Question.category,
+		Question.difficulty
+	).order_by(Question.id)
+	if category is not None:
+		selection = selection.filter(Question.category == category)
+	if difficulty is not None:
+		selection = selection.filter(Question.difficulty == difficulty)
+	# GET /api/questions/export writes each question out as soon as it is
+	# read. That only saves memory if psycopg2 reads through a server-side
+	# cursor; by default it fetches the whole question bank into the worker
+	# on the first row.
+	return selection.execution_options(stream_results=True).yield_per(EXPORT_CHUNK_SIZE)
+
+def export_lines(category=None, difficulty=None):
+	# One JSON document per question, newline delimited (NDJSON).
+	for row in export_query(category, difficulty):
+		yield json.dumps(row._asdict()) + '\n'
+
+@click.command('export-questions')
+@click.argument('path', default='-', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--category', type=int, help='Only export questions of this category id.')
+@click.option('--difficulty', type=int, help='Only export questions of this difficulty.')
+@with_appcontext
+def export_questions_command(path, category, difficulty):
+	"""Export questions as NDJSON to PATH (stdout by default)."""
+	exported = 0
+	with click.open_file(path, 'w', encoding='utf-8') as stream:
+		for line in export_lines(category, difficulty):
+			stream.write(line)
+			exported += 1
+	click.echo('Exported {} questions.'.format(exported), err=True)
@@ -0,0 +1,133 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+
+from .sampling import random_question_ids
+
+# Seconds a quiz session survives without being played.
+QUIZ_SESSION_TTL = 3600
+
+# Questions drawn per quiz; the frontend plays five (questionsPerPlay).
+QUIZ_LENGTH = 5
+
+def draw_question_ids(category_id=None, previous_questions=(), length=QUIZ_LENGTH):
+	# The whole quiz is drawn up front, so every question after that is a pop.
+	# Only the questions the quiz will play are drawn and stored, whatever the
+	# size of the category.
+	return random_question_ids(length, previous_questions, category_id)
+
+
+class MemoryQuizSessionStore(object):
+	# Sessions live in this process; fine for a single worker.
+
+	def __init__(self, ttl=QUIZ_SESSION_TTL):
+		self.ttl = ttl
+		self._lock = threading.Lock()
+		self._sessions = {}
+		self._next_sweep = time.time() + ttl
+
+	def create(self, question_ids):
+		session_id = uuid.uuid4().hex
+		now = time.time()
+		with self._lock:
+			self._sweep(now)
+			self._sessions[session_id] = [now + self.ttl, list(question_ids)]
+		return session_id
+
+	def pop(self, session_id):
+		# Returns the next question id, None once the quiz is exhausted, and
+		# raises KeyError for unknown or expired sessions.
+		now = time.time()
+		with self._lock:
+			session = self._sessions.get(session_id)
+			if session is None or session[0] < now:
+				self._sessions.pop(session_id, None)
+				raise KeyError(session_id)
+			session[0] = now + self.ttl
+			return session[1].pop() if session[1] else None
+
+	def _sweep(self, now):
+		if now < self._next_sweep:
+			return
+		for session_id in [session_id for session_id, session in self._sessions.items() if session[0] < now]:
+			del self._sessions[session_id]
+		self._next_sweep = now + self.ttl
+
+
+class SQLiteQuizSessionStore(object):
+	# Sessions in a SQLite file, shared by every worker on the host and kept
+	# across restarts. Each queued question is a row keyed by (session,
+	# position), so a pop reads and deletes the last row through the
+	# primary key.
+
+	def __init__(self, path, ttl=QUIZ_SESSION_TTL):
+		self.path = path
+		self.ttl = ttl
+		self._local = threading.local()
+		with self._connect() as connection:
+			connection.executescript('''
+				CREATE TABLE IF NOT EXISTS quiz_sessions (
+					id TEXT PRIMARY KEY,
+					expires REAL NOT NULL
+				);
+				CREATE TABLE IF NOT EXISTS quiz_session_questions (
+					session_id TEXT NOT NULL,
+					position INTEGER NOT NULL,
+					question_id INTEGER NOT NULL,
+					PRIMARY KEY (session_id, position)
+				) WITHOUT ROWID;
+			''')
+
+	def _connect(self):
+		connection = getattr(self._local, 'connection', None)
+		if connection is None:
+			connection = self._local.connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+		return connection
+
+	def create(self, question_ids):
+		session_id = uuid.uuid4().hex
+		now = time.time()
+		connection = self._connect()
+		connection.execute('BEGIN IMMEDIATE')
+		try:
+			expired = "SELECT id FROM quiz_sessions WHERE expires < ?"
+			connection.execute('DELETE FROM quiz_session_questions WHERE session_id IN ({})'.format(expired), (now,))
+			connection.execute('DELETE FROM quiz_sessions WHERE expires < ?', (now,))
+			connection.execute('INSERT INTO quiz_sessions (id, expires) VALUES (?, ?)', (session_id, now + self.ttl))
+			connection.executemany('INSERT INTO quiz_session_questions VALUES (?, ?, ?)',
+				((session_id, position, question_id) for position, question_id in enumerate(question_ids)))
+			connection.execute('COMMIT')
+		except:
+			connection.execute('ROLLBACK')
+			raise
+		return session_id
+
+	def pop(self, session_id):
+		now = time.time()
+		connection = self._connect()
+		connection.execute('BEGIN IMMEDIATE')
+		try:
+			updated = connection.execute('UPDATE quiz_sessions SET expires = ? WHERE id = ? AND expires >= ?',
+				(now + self.ttl, session_id, now)).rowcount
+			if not updated:
+				raise KeyError(session_id)
+			row = connection.execute('''SELECT position, question_id FROM quiz_session_questions
+				WHERE session_id = ? ORDER BY position DESC LIMIT 1''', (session_id,)).fetchone()
+			if row is not None:
+				connection.execute('DELETE FROM quiz_session_questions WHERE session_id = ? AND position = ?',
+					(session_id, row[0]))
+			connection.execute('COMMIT')
+		except:
+			connection.execute('ROLLBACK')
+			raise
+		return row[1] if row is not None else None
+
+
+def quiz_session_store(config):
+	ttl = config.get('QUIZ_SESSION_TTL', QUIZ_SESSION_TTL)
+	path = config.get('QUIZ_SESSION_DATABASE') or os.environ.get('QUIZ_SESSION_DATABASE')
+	if path:
+		return SQLiteQuizSessionStore(path, ttl)
+	return MemoryQuizSessionStore(ttl)
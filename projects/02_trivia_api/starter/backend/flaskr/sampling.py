@@ -0,0 +1,44 @@
+import random
+from sqlalchemy import func
+
+from models import Question
+
+
+def random_question(previous_questions=(), category_id=None):
+	# Picks a random question without sorting the table: draw a random pivot
+	# between the smallest and largest id in range, then take the first
+	# question at or after it that has not been played yet, wrapping around to
+	# the start of the range. Every step is a walk along the primary key (or
+	# the category index), so the cost does not grow with the table. Ids that
+	# follow a gap are a little more likely to be drawn, which is fine for a
+	# quiz.
+	selection = Question.query
+	if category_id is not None:
+		selection = selection.filter(Question.category == category_id)
+
+	low, high = selection.with_entities(func.min(Question.id), func.max(Question.id)).one()
+	if low is None:
+		return None
+
+	if previous_questions:
+		selection = selection.filter(Question.id.notin_(previous_questions))
+
+	pivot = random.randint(low, high)
+	question = selection.filter(Question.id >= pivot).order_by(Question.id).first()
+	if question is None:
+		question = selection.filter(Question.id < pivot).order_by(Question.id).first()
+	return question
+
+
+def random_question_ids(count, previous_questions=(), category_id=None):
+	# Up to count distinct question ids drawn as in random_question(), fewer
+	# if the category runs out. A handful of index lookups per question, so a
+	# quiz over the whole table costs the same as one over a small category.
+	excluded = list(previous_questions)
+	drawn = []
+	while len(drawn) < count:
+		question = random_question(excluded + drawn, category_id)
+		if question is None:
+			break
+		drawn.append(question.id)
+	return drawn
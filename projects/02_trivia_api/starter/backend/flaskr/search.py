@@ -0,0 +1,37 @@
+from sqlalchemy import func
+
+from models import db, Question
+
+def like_pattern(term):
+	# searchTerm is whatever was typed in the frontend's search box; a '%' or
+	# '_' in it means itself, not "anything". Backslash is the escape
+	# character search_questions hands to ilike().
+	escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+	return '%{}%'.format(escaped)
+
+def search_questions(term, page, per_page):
+	# Returns one page of matching questions, closest match first, and the
+	# number of matches for total_questions. On PostgreSQL the substring
+	# match uses ix_questions_question_trgm and the order is similarity to
+	# the term; the SQLite test database has neither, so it orders by id.
+	# The count comes back on each row (count(*) OVER ()), saving a second
+	# query.
+	page = max(page, 1)
+	selection = Question.query.filter(Question.question.ilike(like_pattern(term), escape='\\'))
+	if db.engine.dialect.name == 'postgresql':
+		selection = selection.order_by(func.similarity(Question.question, term).desc(), Question.id)
+	else:
+		selection = selection.order_by(Question.id)
+
+	rows = selection.add_columns(func.count().over().label('total')) \
+		.limit(per_page).offset((page - 1) * per_page).all()
+	if rows:
+		total = rows[0].total
+	elif page > 1:
+		# A page past the end has no rows and so no count, yet the frontend
+		# still draws its page links from total_questions.
+		total = selection.order_by(None).count()
+	else:
+		total = 0
+
+	return [question.format() for question, _ in rows], total
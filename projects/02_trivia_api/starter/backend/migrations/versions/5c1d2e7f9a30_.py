@@ -0,0 +1,29 @@
+"""trigram search index on questions.question
+
+Revision ID: 5c1d2e7f9a30
+Revises: 
+Create Date: 2026-10-18 14:02:17.331874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1d2e7f9a30'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # First revision: the tables themselves come from trivia.psql or from
+    # setup_db's create_all. The latter already builds the index from the
+    # model, hence IF NOT EXISTS.
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_questions_question_trgm '
+               'ON questions USING gin (question gin_trgm_ops)')
+
+
+def downgrade():
+    op.drop_index('ix_questions_question_trgm', table_name='questions')
@@ -0,0 +1,50 @@
+"""integer category foreign key, (category, id) index and question counts
+
+Revision ID: a3f4b6c8d210
+Revises: 5c1d2e7f9a30
+Create Date: 2026-10-18 15:26:40.118602
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f4b6c8d210'
+down_revision = '5c1d2e7f9a30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases restored from trivia.psql already have an integer column and
+    # the foreign key. Ones created by setup_db's create_all already have the
+    # whole schema of this revision, so no step below may assume it is missing.
+    op.alter_column('questions', 'category', type_=sa.Integer(),
+                    postgresql_using='category::integer')
+    op.execute('''
+        UPDATE questions SET category = NULL
+        WHERE category IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM categories WHERE categories.id = questions.category)''')
+    op.execute('''
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                           WHERE conrelid = 'questions'::regclass AND contype = 'f') THEN
+                ALTER TABLE questions ADD CONSTRAINT questions_category_fkey
+                    FOREIGN KEY (category) REFERENCES categories (id)
+                    ON UPDATE CASCADE ON DELETE SET NULL;
+            END IF;
+        END
+        $$''')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_questions_category_id ON questions (category, id)')
+
+    op.execute('ALTER TABLE categories ADD COLUMN IF NOT EXISTS question_count integer DEFAULT 0 NOT NULL')
+    op.execute('''
+        UPDATE categories SET question_count = (
+            SELECT count(*) FROM questions WHERE questions.category = categories.id)''')
+
+
+def downgrade():
+    op.drop_column('categories', 'question_count')
+    op.drop_index('ix_questions_category_id', table_name='questions')
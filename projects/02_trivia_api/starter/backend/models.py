@@ -1,12 +1,17 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, DDL, event, func, select, create_engine
+from sqlalchemy.orm.attributes import get_history
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from flask.cli import with_appcontext
+import click
 import json
 
 database_name = "trivia"
 database_path = "postgres://{}@{}/{}".format('postgres','localhost:5432', database_name)
 
 db = SQLAlchemy()
+migrate = Migrate()
 
 '''
 setup_db(app)
@@ -17,6 +22,8 @@ def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+    migrate.init_app(app, db)
+    app.cli.add_command(refresh_question_counts_command)
     db.create_all()
 
 '''
@@ -29,9 +36,18 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
+  __table_args__ = (
+    # Category pages and category quizzes walk one category in id order.
+    Index('ix_questions_category_id', 'category', 'id'),
+    # Trigram index behind the question search (flaskr/search.py); it serves
+    # the ILIKE '%term%' filter as well as the similarity ranking.
+    Index('ix_questions_question_trgm', 'question',
+          postgresql_using='gin', postgresql_ops={'question': 'gin_trgm_ops'}),
+  )
+
   def __init__(self, question, answer, category, difficulty):
     self.question = question
     self.answer = answer
@@ -58,6 +74,10 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+# create_all() needs the extension for the trigram index, just as the migration does.
+event.listen(Question.__table__, 'before_create',
+  DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 '''
 Category
 
@@ -67,6 +87,9 @@ class Category(db.Model):
 
   id = Column(Integer, primary_key=True)
   type = Column(String)
+  # Number of questions in the category, kept up to date on every write (see
+  # adjust_question_counts) so category pages get their total without a COUNT.
+  question_count = Column(Integer, nullable=False, default=0, server_default='0')
 
   def __init__(self, type):
     self.type = type
@@ -80,4 +103,52 @@ class Category(db.Model):
   def self_format(self):
     return {
       self.id: self.type
-    }
\ No newline at end of file
+    }
+
+'''
+Question counts
+
+'''
+def adjust_question_counts(bind, deltas):
+  # deltas maps category id -> change in its number of questions.
+  table = Category.__table__
+  for category_id, delta in deltas.items():
+    if category_id is not None and delta:
+      bind.execute(table.update()
+        .where(table.c.id == category_id)
+        .values(question_count=table.c.question_count + delta))
+
+@event.listens_for(Question, 'after_insert')
+def question_inserted(mapper, connection, target):
+  adjust_question_counts(connection, {target.category: 1})
+
+@event.listens_for(Question, 'after_delete')
+def question_deleted(mapper, connection, target):
+  adjust_question_counts(connection, {target.category: -1})
+
+@event.listens_for(Question, 'after_update')
+def question_updated(mapper, connection, target):
+  history = get_history(target, 'category')
+  if history.has_changes():
+    deltas = {}
+    for category_id in history.deleted:
+      deltas[category_id] = deltas.get(category_id, 0) - 1
+    for category_id in history.added:
+      deltas[category_id] = deltas.get(category_id, 0) + 1
+    adjust_question_counts(connection, deltas)
+
+def refresh_question_counts(bind):
+  # Recounts every category from scratch, e.g. after questions were loaded
+  # behind the application's back.
+  questions = Question.__table__
+  categories = Category.__table__
+  count = select([func.count()]).where(questions.c.category == categories.c.id).as_scalar()
+  bind.execute(categories.update().values(question_count=count))
+
+@click.command('refresh-question-counts')
+@with_appcontext
+def refresh_question_counts_command():
+  """Recount the questions in every category."""
+  refresh_question_counts(db.session)
+  db.session.commit()
+  click.echo('Question counts refreshed.')
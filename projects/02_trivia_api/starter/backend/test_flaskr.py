@@ -1,23 +1,22 @@
 import os
+import sys
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+import pytest
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from models import Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
-    """This class represents the trivia test case"""
+    """This class represents the trivia test case
 
-    def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}@{}/{}".format('postgres','localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+    The app, its test database and the transaction each test runs in come
+    from the fixtures in conftest.py, which also set self.app, self.client
+    and self.db.
+    """
 
+    def setUp(self):
+        """Define test variables."""
         self.new_question = {
             'question': 'New Question',
             'answer': 'New Answer',
@@ -25,13 +24,6 @@ class TriviaTestCase(unittest.TestCase):
             'difficulty': 5
         }
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-    
     def tearDown(self):
         """Executed after reach test"""
         pass
@@ -40,6 +32,37 @@ class TriviaTestCase(unittest.TestCase):
     TODO
     Write at least one test for each test for successful operation and for expected errors.
     """
+    def test_get_categories(self):
+        res = self.client().get('/api/categories/')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['categories']))
+        self.assertTrue(res.headers.get('ETag'))
+
+    def test_304_if_categories_not_modified(self):
+        etag = self.client().get('/api/categories/').headers['ETag']
+        res = self.client().get('/api/categories/', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_categories_refreshed_after_write(self):
+        client = self.client()
+        etag = client.get('/api/categories/').headers['ETag']
+        with self.app.app_context():
+            category = Category(type='Music')
+            self.db.session.add(category)
+            self.db.session.commit()
+            res = client.get('/api/categories/', headers={'If-None-Match': etag})
+            data = json.loads(res.data)
+            self.db.session.delete(category)
+            self.db.session.commit()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Music', [category['type'] for category in data['categories']])
+
     def test_get_paginated_questions(self):
         """Test _____________ """
         res = self.client().get('/api/questions')
@@ -61,6 +84,25 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
 
+    def test_get_questions_after_cursor(self):
+        first_page = json.loads(self.client().get('/api/questions').data)
+        res = self.client().get('/api/questions?cursor={}'.format(first_page['next_cursor']))
+        data = json.loads(res.data)
+        second_page = json.loads(self.client().get('/api/questions?page=2').data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['questions'], second_page['questions'])
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+
+    def test_400_sent_with_malformed_cursor(self):
+        res = self.client().get('/api/questions?cursor=not-a-cursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
     def test_create_new_question(self):
         res = self.client().post('/api/questions', json=self.new_question)
         data = json.loads(res.data)
@@ -69,6 +111,61 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['created'])
 
+    def test_create_and_delete_question_batch(self):
+        res = self.client().post('/api/questions/batch', json=[self.new_question, self.new_question])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['created'], 2)
+        ids = [result['id'] for result in data['results']]
+
+        res = self.client().delete('/api/questions/batch', json=ids + [100000])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 2)
+        self.assertEqual([result['deleted'] for result in data['results']], [True, True, False])
+
+    def test_422_if_question_batch_has_invalid_items(self):
+        res = self.client().post('/api/questions/batch', json=[self.new_question, {'question': 'No answer'}])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual([result['index'] for result in data['results']], [1])
+
+    def test_question_batch_accepts_category_created_elsewhere(self):
+        with self.app.app_context():
+            self.client().get('/api/categories/')
+            # Straight in the database, so the app's cache never hears of it.
+            self.db.session.execute("INSERT INTO categories (id, type, question_count) VALUES (100, 'Music', 0)")
+            self.db.session.commit()
+            res = self.client().post('/api/questions/batch', json=[dict(self.new_question, category=100)])
+            data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['created'], 1)
+
+    def test_category_total_follows_writes(self):
+        before = json.loads(self.client().get('/api/categories/2/questions').data)['total_questions']
+        created = json.loads(self.client().post('/api/questions', json=self.new_question).data)['created']
+        during = json.loads(self.client().get('/api/categories/2/questions').data)['total_questions']
+        self.client().delete('/api/questions/{}'.format(created))
+        after = json.loads(self.client().get('/api/categories/2/questions').data)['total_questions']
+
+        self.assertEqual(during, before + 1)
+        self.assertEqual(after, before)
+
+    def test_export_questions_by_category(self):
+        res = self.client().get('/api/questions/export?category=1')
+        questions = [json.loads(line) for line in res.data.decode().splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertTrue(len(questions))
+        self.assertEqual(set(question['category'] for question in questions), {1})
+
     def test_405_if_question_creation_not_allowed(self):
         res = self.client().post('/api/questions/45', json=self.new_question)
         data = json.loads(res.data)
@@ -86,6 +183,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertEqual(len(data['questions']), 2)
 
+    def test_get_question_search_second_page(self):
+        first_page = json.loads(self.client().post('/api/questions', json={'searchTerm': 'e'}).data)
+        res = self.client().post('/api/questions?page=2', json={'searchTerm': 'e'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+        self.assertEqual(len(data['questions']), data['total_questions'] - len(first_page['questions']))
+        self.assertFalse(set(q['id'] for q in data['questions']) & set(q['id'] for q in first_page['questions']))
+
     def test_get_question_search_without_results(self):
         res = self.client().post('/api/questions', json={'searchTerm': 'applejacks'})
         data = json.loads(res.data)
@@ -125,6 +232,38 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['question'])
 
+    def test_play_quiz_skips_previous_questions(self):
+        res = self.client().post('/api/quizzes', json={
+                "previous_questions":[20,21],
+                "quiz_category": {"type": "Science", "id": 1 }
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question']['id'], 22)
+
+    def test_play_quiz_session(self):
+        quiz = {"quiz_session": None, "quiz_category": {"type": "Science", "id": 1}}
+        played = []
+        for _ in range(3):
+            data = json.loads(self.client().post('/api/quizzes', json=quiz).data)
+            self.assertEqual(data['success'], True)
+            played.append(data['question']['id'])
+            quiz = {"quiz_session": data['quiz_session']}
+        data = json.loads(self.client().post('/api/quizzes', json=quiz).data)
+
+        self.assertEqual(sorted(played), [20, 21, 22])
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['question'], False)
+
+    def test_404_if_quiz_session_does_not_exist(self):
+        res = self.client().post('/api/quizzes', json={"quiz_session": "missing"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     def test_no_more_questions_from_category(self):
         res = self.client().post('/api/quizzes', json={
                 "previous_questions":[20,21,22],
@@ -138,4 +277,4 @@ class TriviaTestCase(unittest.TestCase):
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    sys.exit(pytest.main([__file__] + sys.argv[1:]))
\ No newline at end of file
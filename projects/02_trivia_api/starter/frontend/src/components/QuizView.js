@@ -10,6 +10,7 @@ class QuizView extends Component {
     super();
     this.state = {
         quizCategory: null,
+        quizSession: null,
         previousQuestions: [], 
         showAnswer: false,
         categories: {},
@@ -53,7 +54,7 @@ class QuizView extends Component {
       dataType: 'json',
       contentType: 'application/json',
       data: JSON.stringify({
-        previous_questions: previousQuestions,
+        quiz_session: this.state.quizSession,
         quiz_category: this.state.quizCategory
       }),
       xhrFields: {
@@ -62,6 +63,7 @@ class QuizView extends Component {
       crossDomain: true,
       success: (result) => {
         this.setState({
+          quizSession: result.quiz_session,
           showAnswer: false,
           previousQuestions: previousQuestions,
           currentQuestion: result.question,
@@ -90,6 +92,7 @@ class QuizView extends Component {
   restartGame = () => {
     this.setState({
       quizCategory: null,
+      quizSession: null,
       previousQuestions: [], 
       showAnswer: false,
       numCorrect: 0,
@@ -0,0 +1,136 @@
+'''
+Startup benchmark for the coffee shop API.
+
+Boots the app the way a fresh worker process does, several times over, and
+reports how long the process took in total, how long `import src.api` took
+and how long the first GET /drinks took after it. For comparison, a second
+process per run times db_drop_and_create_all(), which every worker used to
+run on import before schema creation moved to `flask init-db`.
+
+    python bench_startup.py --runs 20 --output startup.json
+
+Runs against a scratch SQLite file unless --database-url is given; the
+tables of that database are DROPPED and recreated.
+'''
+import os
+import sys
+import json
+import math
+import argparse
+import tempfile
+import subprocess
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Each runs in a child process of its own and prints its timings, in
+# seconds, as JSON. WORKER is a worker boot and nothing else, so the parent's
+# wall clock time for it is the boot time.
+WORKER = '''
+import json, time
+started = time.perf_counter()
+from src.api import app
+imported = time.perf_counter()
+status = app.test_client().get('/drinks').status_code
+served = time.perf_counter()
+print(json.dumps({
+	'status': status,
+	'import': imported - started,
+	'first_request': served - imported
+}))
+'''
+
+LEGACY_RESET = '''
+import json, time
+from src.api import app
+from src.database.models import db_drop_and_create_all
+started = time.perf_counter()
+with app.app_context():
+	db_drop_and_create_all()
+print(json.dumps({'legacy_reset': time.perf_counter() - started}))
+'''
+
+
+def run_child(script, env):
+	output = subprocess.run([sys.executable, '-c', script], cwd=BACKEND_DIR, env=env,
+		check=True, stdout=subprocess.PIPE).stdout
+	return json.loads(output.decode().splitlines()[-1])
+
+
+def summary(seconds):
+	# There are only --runs boots to go on, so each figure is one of the
+	# measured runs rather than an interpolation: p95 of the default 10 runs
+	# is the slowest of them.
+	ordered = sorted(seconds)
+
+	def run_at(fraction):
+		return round(1000 * ordered[max(int(math.ceil(fraction * len(ordered))) - 1, 0)], 2)
+
+	return {
+		'p50_ms': run_at(0.50),
+		'p95_ms': run_at(0.95),
+		'max_ms': run_at(1.0)
+	}
+
+
+def source_revision():
+	# Boot time is what an uncommitted change to src/ is usually being tried
+	# out for, so such runs are labelled -dirty rather than as the commit.
+	try:
+		return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=BACKEND_DIR,
+			stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Startup benchmark for the coffee shop API.')
+	parser.add_argument('--database-url', help='Database to run against (default: a scratch SQLite file).')
+	parser.add_argument('--runs', type=int, default=10)
+	parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+	args = parser.parse_args()
+
+	scratch = None
+	database_url = args.database_url
+	if database_url is None:
+		scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+		scratch.close()
+		database_url = 'sqlite:///' + scratch.name
+	env = dict(os.environ, DATABASE_URL=database_url, FLASK_APP='src.api')
+
+	try:
+		subprocess.run([sys.executable, '-m', 'flask', 'init-db', '--drop'], cwd=BACKEND_DIR, env=env,
+			check=True, stdout=subprocess.DEVNULL)
+		runs = []
+		for _ in range(args.runs):
+			started = time.perf_counter()
+			run = run_child(WORKER, env)
+			run['process'] = time.perf_counter() - started
+			run.update(run_child(LEGACY_RESET, env))
+			runs.append(run)
+	finally:
+		if scratch is not None:
+			os.remove(scratch.name)
+
+	results = dict((name, summary([run[name] for run in runs]))
+		for name in ('process', 'import', 'first_request', 'legacy_reset'))
+	for name, result in results.items():
+		print('{:<14} p50 {p50_ms:>8.2f}ms  p95 {p95_ms:>8.2f}ms  max {max_ms:>8.2f}ms'.format(name, **result),
+			file=sys.stderr)
+
+	report = json.dumps({
+		'commit': source_revision(),
+		'database': database_url.split('://')[0],
+		'runs': args.runs,
+		'statuses': sorted(set(run['status'] for run in runs)),
+		'results': results
+	}, indent=2)
+	if args.output:
+		with open(args.output, 'w') as output:
+			output.write(report + '\n')
+	else:
+		print(report)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,32 @@
+"""drink table
+
+Revision ID: 4e8a1c2b7d90
+Revises: 
+Create Date: 2026-10-18 18:02:11.408317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8a1c2b7d90'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The schema db_drop_and_create_all() used to create. Databases made that
+    # way can be marked as being at this revision with `flask db stamp 4e8a1c2b7d90`.
+    op.create_table('drink',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=80), nullable=True),
+    sa.Column('recipe', sa.String(length=180), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('title')
+    )
+
+
+def downgrade():
+    op.drop_table('drink')
@@ -0,0 +1,36 @@
+"""recipe as JSON (JSONB on postgres)
+
+Revision ID: 9b3f5d7e1a24
+Revises: 4e8a1c2b7d90
+Create Date: 2026-10-18 18:09:47.551092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3f5d7e1a24'
+down_revision = '4e8a1c2b7d90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The stored strings are already JSON documents, so they convert in place.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('drink', 'recipe', type_=postgresql.JSONB(),
+                        postgresql_using='recipe::jsonb')
+    else:
+        with op.batch_alter_table('drink') as batch_op:
+            batch_op.alter_column('recipe', type_=sa.JSON(), existing_nullable=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('drink', 'recipe', type_=sa.String(length=180),
+                        postgresql_using='recipe::text')
+    else:
+        with op.batch_alter_table('drink') as batch_op:
+            batch_op.alter_column('recipe', type_=sa.String(length=180), existing_nullable=False)
@@ -1,52 +1,53 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, Response, request, jsonify, abort
 from sqlalchemy import exc
-import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import setup_db, Drink
 from .auth.auth import AuthError, requires_auth
+from .menu import MenuCache
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+menu_cache = MenuCache()
 
 '''
-@TODO uncomment the following line to initialize the datbase
-!! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
-!! NOTE THIS MUST BE UNCOMMENTED ON FIRST RUN
+Importing this module has no side effects on the database; create the
+schema and seed it once with `flask init-db` before the first start.
 '''
-db_drop_and_create_all()
+
+def menu_response(menu, payload):
+	response = Response(payload.body, mimetype='application/json')
+	response.set_etag(payload.etag)
+	response.last_modified = menu.last_modified
+	# A new or edited drink has to show up on the next poll, so browsers ask
+	# before reusing a stored menu; the answer is a 304 until a drink changes.
+	response.cache_control.no_cache = True
+	# Turns the response into a 304 when If-None-Match or If-Modified-Since match.
+	return response.make_conditional(request)
+
 
 ## ROUTES
 @app.route('/drinks', methods=['GET'])
 def retrieve_drinks():
-	selection = Drink.query.order_by(Drink.id).all()
+	menu = menu_cache.get()
 
-	if len(selection) == 0:
+	if menu.count == 0:
 		abort(404)
-	
-	formatted_drinks = [drink.short() for drink in selection]
 
-	return jsonify({
-		'success': True,
-		'drinks': formatted_drinks
-	})
+	return menu_response(menu, menu.short)
 
 
 @app.route('/drinks-detail', methods=['GET'])
 @requires_auth('get:drinks-detail')
 def retrieve_drinks_detail(payload):
-	selection = Drink.query.order_by(Drink.id).all()
-	formatted_drinks = [drink.long() for drink in selection]
+	menu = menu_cache.get()
 
-	if len(selection) == 0:
+	if menu.count == 0:
 		abort(404)
 
-	return jsonify({
-		'success': True,
-		'drinks': formatted_drinks
-	})
+	return menu_response(menu, menu.long)
 
 
 @app.route('/drinks', methods=['POST'])
@@ -56,10 +57,9 @@ def create_drinks(payload):
 
 	new_title = body.get('title', None)
 	new_recipe = body.get('recipe', None)
-	recipe_json	= json.dumps(new_recipe)
 
 	try:
-		drink = Drink(title=new_title, recipe=recipe_json)
+		drink = Drink(title=new_title, recipe=new_recipe)
 		drink.insert()
 
 		return jsonify({
@@ -93,8 +93,7 @@ def update_drinks(payload, drink_id):
 			drink.title = new_title
 		
 		if new_recipe is not None:
-			recipe_json	= json.dumps(new_recipe)
-			drink.recipe = recipe_json
+			drink.recipe = new_recipe
 
 		drink.update()
 
@@ -148,9 +147,9 @@ def not_found(error):
 
 
 @app.errorhandler(AuthError)
-def unauthorized(err):
+def auth_error(err):
 	return jsonify({
 		"success": False,
 		"error": err.status_code,
 		"message": err.error
-		}), 401
\ No newline at end of file
+		}), err.status_code
\ No newline at end of file
@@ -1,4 +1,9 @@
+import os
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
@@ -8,6 +13,17 @@ from urllib.request import urlopen
 AUTH0_DOMAIN = 'fsnd-apf.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffee'
+# Anything urlopen understands, so a local key set can stand in for Auth0:
+# JWKS_URL=file:///path/to/jwks.json
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+# Seconds a fetched key set is used before it is refreshed in the background.
+JWKS_TTL = int(os.environ.get('JWKS_TTL', 600))
+# Minimum seconds between fetches, so tokens with made-up kids or an
+# unreachable identity provider cannot turn every request into a fetch.
+JWKS_MIN_REFETCH_INTERVAL = int(os.environ.get('JWKS_MIN_REFETCH_INTERVAL', 30))
+JWKS_FETCH_TIMEOUT = 5
+# Verified tokens kept in memory; clients send the same token until it expires.
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
 
 ## AuthError Exception
 '''
@@ -20,6 +36,162 @@ class AuthError(Exception):
 				self.status_code = status_code
 
 
+## JWKS
+
+'''
+JWKSCache
+The signing keys of the identity provider, by kid. The key set is fetched on
+first use and then served from memory; once it is older than the TTL the next
+lookup still answers from memory and refreshes it on a background thread, so
+a slow or failing identity provider only delays key rotation. A kid that is
+not in the set forces a fetch, at most once per min_refetch_interval.
+'''
+class JWKSCache(object):
+		def __init__(self, url, ttl=JWKS_TTL, min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL,
+				timeout=JWKS_FETCH_TIMEOUT):
+				self.url = url
+				self.ttl = ttl
+				self.min_refetch_interval = min_refetch_interval
+				self.timeout = timeout
+				self._keys = {}
+				self._fetched_at = None
+				self._attempted_at = None
+				# Held by whoever is fetching, so there is one fetch at a time.
+				self._lock = threading.Lock()
+
+		def fetch(self):
+				with urlopen(self.url, timeout=self.timeout) as response:
+						jwks = json.loads(response.read())
+				return dict((key['kid'], {
+						'kty': key['kty'],
+						'kid': key['kid'],
+						'use': key['use'],
+						'n': key['n'],
+						'e': key['e']
+				}) for key in jwks['keys'])
+
+		def refresh(self):
+				self._attempted_at = time.monotonic()
+				self._keys = self.fetch()
+				self._fetched_at = time.monotonic()
+
+		def _may_fetch(self):
+				return (self._attempted_at is None or
+						time.monotonic() - self._attempted_at >= self.min_refetch_interval)
+
+		def _refresh_quietly(self):
+				try:
+						self.refresh()
+				except Exception:
+						# Keep the keys we have; the next attempt is rate limited.
+						pass
+
+		def _refresh_in_background(self):
+				if not self._lock.acquire(blocking=False):
+						return
+
+				def run():
+						try:
+								self._refresh_quietly()
+						finally:
+								self._lock.release()
+
+				threading.Thread(target=run, daemon=True).start()
+
+		def get(self, kid):
+				if self._fetched_at is None:
+						with self._lock:
+								if self._fetched_at is None and self._may_fetch():
+										self._refresh_quietly()
+						if self._fetched_at is None:
+								raise AuthError({
+										'code': 'jwks_unavailable',
+										'description': 'Unable to fetch the signing keys.'
+								}, 503)
+				elif time.monotonic() - self._fetched_at > self.ttl and self._may_fetch():
+						self._refresh_in_background()
+
+				key = self._keys.get(kid)
+				if key is None and self._may_fetch():
+						with self._lock:
+								if kid not in self._keys and self._may_fetch():
+										self._refresh_quietly()
+						key = self._keys.get(kid)
+				return key
+
+
+jwks_cache = JWKSCache(JWKS_URL)
+
+
+## Verified Tokens
+
+'''
+TokenCache
+An LRU of tokens whose signature and claims have already been verified, keyed
+by the SHA-256 of the token so the tokens themselves are not kept around. An
+entry holds the payload and its permissions as a frozenset, and is dropped
+once the token's exp has passed; tokens without an exp are not cached.
+Counts hits and misses, and the time spent verifying on misses.
+'''
+class TokenCache(object):
+		def __init__(self, size=TOKEN_CACHE_SIZE):
+				self.size = size
+				self._entries = OrderedDict()
+				self._lock = threading.Lock()
+				self.hits = 0
+				self.misses = 0
+				self.verify_seconds = 0.0
+
+		def get(self, token, verify):
+				# Returns (payload, permissions), calling verify(token) on a miss.
+				key = hashlib.sha256(token.encode('utf-8')).digest()
+				with self._lock:
+						entry = self._entries.get(key)
+						if entry is not None:
+								if entry[0] > time.time():
+										self._entries.move_to_end(key)
+										self.hits += 1
+										return entry[1], entry[2]
+								del self._entries[key]
+						self.misses += 1
+
+				started = time.perf_counter()
+				try:
+						payload = verify(token)
+				finally:
+						elapsed = time.perf_counter() - started
+						with self._lock:
+								self.verify_seconds += elapsed
+
+				permissions = payload.get('permissions')
+				if isinstance(permissions, list):
+						permissions = frozenset(permissions)
+				if isinstance(payload.get('exp'), (int, float)) and self.size > 0:
+						with self._lock:
+								self._entries[key] = (payload['exp'], payload, permissions)
+								self._entries.move_to_end(key)
+								while len(self._entries) > self.size:
+										self._entries.popitem(last=False)
+				return payload, permissions
+
+		def stats(self):
+				with self._lock:
+						return {
+								'size': len(self._entries),
+								'hits': self.hits,
+								'misses': self.misses,
+								'verify_seconds': self.verify_seconds,
+								'verify_ms_per_miss': 1000 * self.verify_seconds / self.misses if self.misses else None
+						}
+
+		def clear(self):
+				with self._lock:
+						self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
 ## Auth Header
 
 def get_token_auth_header():
@@ -55,14 +227,17 @@ def get_token_auth_header():
 		return token
 
 
-def check_permissions(permission, payload):
+def check_permissions(permission, payload, permissions=None):
+		# permissions, when given, is payload['permissions'] as a set.
 		if 'permissions' not in payload:
 				raise AuthError({
 						'code': 'invalid_claims',
 						'description': 'Permissions not included in JWT.'
 				}, 400)
 
-		if permission not in payload['permissions']:
+		if permissions is None:
+				permissions = payload['permissions']
+		if permission not in permissions:
 				raise AuthError({
 						'code': 'unauthorized',
 						'description': 'Permission not found.'
@@ -71,25 +246,14 @@ def check_permissions(permission, payload):
 
 
 def verify_decode_jwt(token):
-		jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-		jwks = json.loads(jsonurl.read())
 		unverified_header = jwt.get_unverified_header(token)
-		rsa_key = {}
 		if 'kid' not in unverified_header:
 				raise AuthError({
 						'code': 'invalid_header',
 						'description': 'Authorization malformed.'
 				}, 401)
 
-		for key in jwks['keys']:
-				if key['kid'] == unverified_header['kid']:
-						rsa_key = {
-								'kty': key['kty'],
-								'kid': key['kid'],
-								'use': key['use'],
-								'n': key['n'],
-								'e': key['e']
-						}
+		rsa_key = jwks_cache.get(unverified_header['kid'])
 		if rsa_key:
 				try:
 						payload = jwt.decode(
@@ -129,8 +293,8 @@ def requires_auth(permission=''):
 				@wraps(f)
 				def wrapper(*args, **kwargs):
 						token = get_token_auth_header()
-						payload = verify_decode_jwt(token)
-						check_permissions(permission, payload)
+						payload, permissions = token_cache.get(token, verify_decode_jwt)
+						check_permissions(permission, payload, permissions)
 						return f(payload, *args, **kwargs)
 
 				return wrapper
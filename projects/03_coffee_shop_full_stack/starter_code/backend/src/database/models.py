@@ -1,23 +1,35 @@
 import os
-from sqlalchemy import Column, String, Integer
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Column, String, Integer, JSON, inspect
+from sqlalchemy.dialects.postgresql import JSONB
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate, stamp, upgrade
+from alembic.migration import MigrationContext
 import json
 
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+# DATABASE_URL points every worker at a shared database instead of the sqlite file
+database_path = os.environ.get('DATABASE_URL', "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
 
 db = SQLAlchemy()
+# migrations/ lives next to src/, wherever flask is run from
+migrate = Migrate(directory=os.path.join(project_dir, os.pardir, os.pardir, 'migrations'))
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    nothing connects to the database here, the engine is created on first use
+    the schema is created with `flask init-db` (or `flask db upgrade`), not on import
 '''
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+    migrate.init_app(app, db)
+    app.cli.add_command(init_db_command)
 
 '''
 db_drop_and_create_all()
@@ -30,11 +42,57 @@ def db_drop_and_create_all():
     db.create_all()
 
     # after droping and creating db, adds one drink to the list so that GET /drinks doesn't throw 404 with empty list
-    json_recipe = json.dumps([{'name':'milk', 'color':'#fdfdfd', 'parts': 3},{'name':'coffee', 'color':'brown', 'parts': 1}])
-    drink = Drink(title="Latte", recipe=json_recipe)
+    seed_db()
+
+'''
+seed_db()
+    adds the Latte to an empty menu so that GET /drinks doesn't throw 404
+    does nothing if there are drinks already
+'''
+def seed_db():
+    if Drink.query.first() is not None:
+        return
+    recipe = [{'name':'milk', 'color':'#fdfdfd', 'parts': 3},{'name':'coffee', 'color':'brown', 'parts': 1}]
+    drink = Drink(title="Latte", recipe=recipe)
     db.session.add(drink)
     db.session.commit()
 
+'''
+flask init-db
+    one-off setup before the first start, then safe to run on every deploy
+    on an empty database: creates the tables, marks them as being at the
+    latest migration and seeds the menu
+    on a database with a migration revision: applies the pending migrations
+    a database with tables but no revision (made by db_drop_and_create_all()
+    before migrations existed) has to be stamped by hand first
+    --drop starts from scratch, dropping every table first
+'''
+@click.command('init-db')
+@click.option('--drop', is_flag=True, help='Drop all tables first. THIS DELETES ALL RECORDS.')
+@with_appcontext
+def init_db_command(drop):
+    """Create or upgrade the tables and seed the menu."""
+    if drop:
+        db_drop_and_create_all()
+        stamp()
+        click.echo('Recreated the database.')
+        return
+
+    with db.engine.connect() as connection:
+        revision = MigrationContext.configure(connection).get_current_revision()
+    tables = inspect(db.engine).get_table_names()
+    if revision is not None:
+        upgrade()
+    elif Drink.__tablename__ not in tables:
+        db.create_all()
+        stamp()
+    else:
+        raise click.ClickException(
+            'The database has a drink table but no migration revision. If it was made by '
+            'db_drop_and_create_all(), run `flask db stamp 4e8a1c2b7d90` and then `flask init-db` again.')
+    seed_db()
+    click.echo('Initialized the database.')
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -44,21 +102,32 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients, stored as JSON (JSONB on postgres) and loaded as a list
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    recipe =  Column(JSON().with_variant(JSONB, 'postgresql'), nullable=False)
+
+    '''
+    short_recipe
+        the recipe without ingredient names
+        built once per recipe value, a new recipe assigned or loaded rebuilds it
+    '''
+    @property
+    def short_recipe(self):
+        recipe = self.recipe
+        cached = getattr(self, '_short_recipe', None)
+        if cached is None or cached[0] is not recipe:
+            cached = self._short_recipe = (recipe, [{'color': r['color'], 'parts': r['parts']} for r in recipe])
+        return cached[1]
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.short_recipe
         }
 
     '''
@@ -69,7 +138,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe
         }
 
     '''
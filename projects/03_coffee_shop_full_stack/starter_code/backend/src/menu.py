@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .database.models import Drink
+
+# A worker only sees the drink edits committed through it, so a drink added
+# or changed through another worker shows up here at most this many seconds
+# later.
+MENU_CACHE_TTL = int(os.environ.get('MENU_CACHE_TTL', 5))
+
+# A serialized response body and the ETag it is revalidated with.
+Payload = namedtuple('Payload', ['body', 'etag'])
+
+
+def serialize_drinks(drinks):
+	body = json.dumps({
+		'success': True,
+		'drinks': drinks
+	}).encode('utf-8')
+	return Payload(body, hashlib.sha1(body).hexdigest())
+
+
+class Menu(object):
+	# One read of the drink table, serialized with short() recipes for
+	# GET /drinks and with long() recipes for GET /drinks-detail. edits is the
+	# cache's count of committed drink edits from just before the read.
+
+	def __init__(self, drinks, edits, ttl, previous=None):
+		self.edits = edits
+		self.expires = time.monotonic() + ttl
+		self.count = len(drinks)
+		self.short = serialize_drinks([drink.short() for drink in drinks])
+		self.long = serialize_drinks([drink.long() for drink in drinks])
+		if previous is not None and previous.long.etag == self.long.etag:
+			# A PATCH that saved a drink as it was, or just the TTL running
+			# out: the menu reads the same, so it keeps its date and clients
+			# polling with If-Modified-Since still get 304.
+			self.last_modified = previous.last_modified
+		else:
+			self.last_modified = datetime.utcnow().replace(microsecond=0)
+
+
+class MenuCache(object):
+	# Hands out the same Menu until a drink edit is committed in this process
+	# or the TTL runs out; the next request then reads the drinks again.
+
+	def __init__(self, ttl=MENU_CACHE_TTL):
+		self.ttl = ttl
+		self.edits = 0
+		self._menu = None
+		self._lock = threading.Lock()
+		# Marks sessions that flushed a drink until they commit or roll back.
+		self._session_key = ('drinks_edited', id(self))
+		for mapper_event in ('after_insert', 'after_update', 'after_delete'):
+			event.listen(Drink, mapper_event, self._drink_flushed)
+		event.listen(Session, 'after_commit', self._session_committed)
+		event.listen(Session, 'after_rollback', self._session_rolled_back)
+
+	def _drink_flushed(self, mapper, connection, drink):
+		object_session(drink).info[self._session_key] = True
+
+	def _session_committed(self, session):
+		# Counting the edit at flush would let a GET /drinks that reads the
+		# old drinks before the commit cache them as the edited menu.
+		if session.info.pop(self._session_key, False):
+			self.edits += 1
+
+	def _session_rolled_back(self, session):
+		session.info.pop(self._session_key, None)
+
+	def get(self):
+		menu = self._menu
+		if menu is None or menu.edits != self.edits or menu.expires <= time.monotonic():
+			with self._lock:
+				# Requests that queued up behind a rebuild take the menu it
+				# built instead of reading the drinks once each.
+				if self._menu is menu:
+					# edits is read before the query, so an edit committed while
+					# it runs leaves this menu behind and the next request
+					# rebuilds it.
+					edits = self.edits
+					self._menu = Menu(Drink.query.order_by(Drink.id).all(), edits, self.ttl, menu)
+				menu = self._menu
+		return menu